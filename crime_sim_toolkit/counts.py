@@ -0,0 +1,292 @@
+"""
+Containers for crime counts as alternatives to long-format count dataframes
+"""
+
+import pandas as pd
+import numpy as np
+from crime_sim_toolkit import utils
+
+
+class LabelledCounts:
+    """
+    Base for crime counts labelled by distinct times, crime types and LSOAs, where
+    every combination of these has a count (zero if no crimes were reported)
+    """
+
+    def __init__(self, times, crime_types, LSOA_codes):
+        """
+        :param: times pd.DataFrame: distinct times of the counts, the Week and datetime
+                columns for weekly counts or the datetime column for daily counts
+        :param: crime_types np.ndarray: crime types of the counts
+        :param: LSOA_codes np.ndarray: LSOAs of the counts
+        """
+
+        self.times = utils.validate_datetime(times, copy=False)
+        self.crime_types = np.asarray(crime_types)
+        self.LSOA_codes = np.asarray(LSOA_codes)
+
+    @property
+    def time_res(self):
+
+        if 'Week' in self.times.columns:
+            return 'Week'
+
+        return 'datetime'
+
+    @property
+    def columns(self):
+        """
+        Columns of the equivalent counts frame
+        """
+
+        if self.time_res == 'Week':
+            return pd.Index(['Week','datetime','Crime_type','LSOA_code','Counts'])
+
+        return pd.Index(['Counts','Crime_type','LSOA_code','datetime'])
+
+    def __len__(self):
+        """
+        Number of rows of the equivalent counts frame, including zeros
+        """
+
+        return len(self.times) * len(self.crime_types) * len(self.LSOA_codes)
+
+    def label_frame(self):
+        """
+        Frame of the time, crime type and LSOA labels of every count in (time x crime type x LSOA) order
+        """
+
+        n_times, n_crimes, n_LSOAs = len(self.times), len(self.crime_types), len(self.LSOA_codes)
+
+        label_frame = pd.DataFrame({column : np.repeat(self.times[column].values, n_crimes * n_LSOAs)
+                                    for column in self.times.columns})
+
+        label_frame['Crime_type'] = np.tile(np.repeat(self.crime_types, n_LSOAs), n_times)
+
+        label_frame['LSOA_code'] = np.tile(self.LSOA_codes, n_times * n_crimes)
+
+        return label_frame
+
+    def time_years(self):
+        """
+        Year of each distinct time
+        """
+
+        return self.times['datetime'].dt.year.values
+
+
+class SparseCounts(LabelledCounts):
+    """
+    Crime counts stored with implicit zeros.
+
+    Only the non-zero (time, crime type, LSOA) rows of a counts frame are kept, alongside
+    the distinct times, crime types and LSOAs of the full frame. Every combination of these
+    without a row has a count of zero, exactly as the rows added by Initialiser.add_zero_counts.
+    """
+
+    def __init__(self, counts, times, crime_types, LSOA_codes):
+        """
+        :param: counts pd.DataFrame: non-zero counts in the format of Initialiser.add_zero_counts
+        :param: times pd.DataFrame: distinct times of the counts, the Week and datetime
+                columns for weekly counts or the datetime column for daily counts
+        :param: crime_types np.ndarray: crime types of the counts
+        :param: LSOA_codes np.ndarray: LSOAs of the counts
+        """
+
+        super().__init__(times, crime_types, LSOA_codes)
+
+        self.counts = utils.validate_datetime(counts, copy=False)
+
+    @classmethod
+    def from_frame(cls, counts_frame, LSOA_codes=None):
+        """
+        Builds sparse counts from a counts frame with zeros, e.g. from Initialiser.get_data
+
+        :param: counts_frame pd.DataFrame: counts in the format of Initialiser.add_zero_counts
+        :param: LSOA_codes list: LSOAs counted, default the LSOAs of counts_frame
+
+        :return: SparseCounts
+        """
+
+        counts_frame = utils.validate_datetime(counts_frame)
+
+        if 'Week' in counts_frame.columns:
+            time_cols = ['Week','datetime']
+        else:
+            time_cols = ['datetime']
+
+        if LSOA_codes is None:
+            LSOA_codes = counts_frame['LSOA_code'].unique()
+        else:
+            LSOA_codes = pd.Index(LSOA_codes).union(counts_frame['LSOA_code'].unique(), sort=False).values
+
+        return cls(counts=counts_frame[counts_frame['Counts'] != 0].reset_index(drop=True),
+                   times=counts_frame[time_cols].drop_duplicates().reset_index(drop=True),
+                   crime_types=counts_frame['Crime_type'].unique(),
+                   LSOA_codes=LSOA_codes)
+
+    def to_frame(self):
+        """
+        Materialises the zero counts, returning the full counts frame
+
+        :return: pd.DataFrame in the format of Initialiser.add_zero_counts
+        """
+
+        full_frame = self.label_frame()
+
+        keys = self.times.columns.tolist() + ['Crime_type','LSOA_code']
+
+        full_frame = full_frame.merge(self.counts[keys + ['Counts']], how='left', on=keys)
+
+        full_frame['Counts'] = full_frame['Counts'].fillna(0).astype(np.int64)
+
+        return full_frame[self.columns.tolist()]
+
+    def select_years(self, years):
+        """
+        Sparse counts for the times within the given years
+
+        :param: years list: years to keep
+
+        :return: SparseCounts
+        """
+
+        return SparseCounts(counts=self.counts[self.counts['datetime'].dt.year.isin(years)],
+                            times=self.times[np.isin(self.time_years(), years)],
+                            crime_types=self.crime_types,
+                            LSOA_codes=self.LSOA_codes)
+
+
+class CountTensor(LabelledCounts):
+    """
+    Crime counts stored as a dense integer array indexed (time x crime type x LSOA)
+    with label arrays for each axis. Sums over times, crime types or LSOAs are array
+    reductions along an axis rather than groupbys of a counts frame.
+    """
+
+    def __init__(self, counts, times, crime_types, LSOA_codes):
+        """
+        :param: counts np.ndarray: integer (time x crime type x LSOA) array of counts
+        :param: times pd.DataFrame: time labels of the first axis, the Week and datetime
+                columns for weekly counts or the datetime column for daily counts
+        :param: crime_types np.ndarray: crime type labels of the second axis
+        :param: LSOA_codes np.ndarray: LSOA labels of the third axis
+        """
+
+        super().__init__(times, crime_types, LSOA_codes)
+
+        self.counts = np.asarray(counts)
+
+        if self.counts.shape != (len(self.times), len(self.crime_types), len(self.LSOA_codes)):
+            raise ValueError('Counts of shape '+str(self.counts.shape)+' do not match the axis labels.')
+
+    @classmethod
+    def from_frame(cls, counts_frame, LSOA_codes=None):
+        """
+        Builds a count tensor from a counts frame, e.g. from Initialiser.get_data
+
+        :param: counts_frame pd.DataFrame: counts in the format of Initialiser.add_zero_counts
+        :param: LSOA_codes list: LSOAs counted, default the LSOAs of counts_frame
+
+        :return: CountTensor
+        """
+
+        return cls.from_sparse(SparseCounts.from_frame(counts_frame, LSOA_codes=LSOA_codes))
+
+    @classmethod
+    def from_sparse(cls, sparse_counts):
+        """
+        Builds a count tensor from SparseCounts
+
+        :param: sparse_counts SparseCounts: counts to fill the tensor with
+
+        :return: CountTensor
+        """
+
+        time_cols = sparse_counts.times.columns.tolist()
+
+        time_idx = pd.MultiIndex.from_frame(sparse_counts.times).get_indexer(
+                   pd.MultiIndex.from_frame(sparse_counts.counts[time_cols]))
+
+        crime_idx = pd.Index(sparse_counts.crime_types).get_indexer(sparse_counts.counts['Crime_type'])
+
+        LSOA_idx = pd.Index(sparse_counts.LSOA_codes).get_indexer(sparse_counts.counts['LSOA_code'])
+
+        counts = np.zeros((len(sparse_counts.times), len(sparse_counts.crime_types), len(sparse_counts.LSOA_codes)),
+                          dtype=np.int64)
+
+        np.add.at(counts, (time_idx, crime_idx, LSOA_idx), sparse_counts.counts['Counts'].values)
+
+        return cls(counts=counts,
+                   times=sparse_counts.times,
+                   crime_types=sparse_counts.crime_types,
+                   LSOA_codes=sparse_counts.LSOA_codes)
+
+    def to_sparse(self):
+        """
+        The non-zero counts of the tensor
+
+        :return: SparseCounts
+        """
+
+        time_idx, crime_idx, LSOA_idx = np.nonzero(self.counts)
+
+        non_zero = self.times.iloc[time_idx].reset_index(drop=True)
+
+        non_zero['Crime_type'] = self.crime_types[crime_idx]
+        non_zero['LSOA_code'] = self.LSOA_codes[LSOA_idx]
+        non_zero['Counts'] = self.counts[time_idx, crime_idx, LSOA_idx]
+
+        return SparseCounts(counts=non_zero[self.columns.tolist()],
+                            times=self.times,
+                            crime_types=self.crime_types,
+                            LSOA_codes=self.LSOA_codes)
+
+    def to_frame(self):
+        """
+        The counts as a long counts frame
+
+        :return: pd.DataFrame in the format of Initialiser.add_zero_counts
+        """
+
+        full_frame = self.label_frame()
+
+        full_frame['Counts'] = self.counts.ravel()
+
+        return full_frame[self.columns.tolist()]
+
+    def select_years(self, years):
+        """
+        Count tensor of the times within the given years
+
+        :param: years list: years to keep
+
+        :return: CountTensor
+        """
+
+        in_years = np.isin(self.time_years(), years)
+
+        return CountTensor(counts=self.counts[in_years],
+                           times=self.times[in_years].reset_index(drop=True),
+                           crime_types=self.crime_types,
+                           LSOA_codes=self.LSOA_codes)
+
+    def aggregate(self, LSOA_groups):
+        """
+        Sums counts of LSOAs into groups, e.g. police force areas
+
+        :param: LSOA_groups array: group label of each LSOA on the LSOA axis
+
+        :return: CountTensor with groups on the LSOA axis
+        """
+
+        group_idx, groups = pd.factorize(np.asarray(LSOA_groups))
+
+        grouped_counts = np.zeros(self.counts.shape[:2] + (len(groups),), dtype=self.counts.dtype)
+
+        np.add.at(grouped_counts, (slice(None), slice(None), group_idx), self.counts)
+
+        return CountTensor(counts=grouped_counts,
+                           times=self.times,
+                           crime_types=self.crime_types,
+                           LSOA_codes=np.asarray(groups))
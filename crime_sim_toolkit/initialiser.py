@@ -2,13 +2,17 @@
 #       or a series of class methods that are called sequentially?
 
 # import libraries
+import os
 import sys
 import glob
-from calendar import monthrange
+import json
+import hashlib
+from multiprocessing.pool import ThreadPool
 import pandas as pd
 import numpy as np
 import pkg_resources
-from crime_sim_toolkit import utils
+from crime_sim_toolkit import utils, reference
+from crime_sim_toolkit.counts import SparseCounts, CountTensor
 
 # Could be any dot-separated package/module name or a "Requirement"
 resource_package = 'crime_sim_toolkit'
@@ -20,12 +24,15 @@ class Initialiser:
     Requires data from https://data.police.uk/ in data folder
     """
 
+    # columns of the police report files used to build counts
+    report_columns = ['Month','LSOA code','Crime type']
+
     def __init__(self, LA_names):
 
         self.LA_names = LA_names
 
         # boot up LSOA lists from 2011 census
-        LSOA_pop = pd.read_csv(pkg_resources.resource_filename(resource_package, 'src/LSOA_data/census_2011_population_hh.csv'))
+        LSOA_pop = reference.LSOA_population()
 
         LSOA_pop = LSOA_pop[LSOA_pop['Local authority name'].isin(LA_names)]
 
@@ -33,16 +40,15 @@ class Initialiser:
 
         LSOA_counts.columns = ['LSOA_code','LSOA_name','persons','households']
 
-        LSOA_counts.persons = LSOA_counts.persons.apply(lambda x: np.int64(x.replace(',', '')))
-
-        LSOA_counts.households = LSOA_counts.households.apply(lambda x: np.int64(x.replace(',', '')))
-
         self.LSOA_hh_counts = LSOA_counts
 
-        self.PolForce_LSOA_map = pd.read_csv(pkg_resources.resource_filename(resource_package, 'src/LSOA_data/PoliceforceLSOA.csv'),
-                                        index_col=0)
+        self.PolForce_LSOA_map = reference.police_force_LSOA()
 
-    def get_data(self, directory=None, timeframe='Week', aggregate=False):
+        # police force of each LSOA
+        self.LSOA_force = reference.LSOA_force()
+
+    def get_data(self, directory=None, timeframe='Week', aggregate=False, nthreads=1, rng=None,
+                 counts_format='frame', cache_dir=None):
         """
         One-caller function that loads and manipulates data ready for use
 
@@ -52,29 +58,191 @@ class Initialiser:
           timeframe = the desired timeframe of data. Either Week or Day. Default Week.
 
           aggregate = boolean: do you wish to aggregate data to police force area. Default false.
+
+          nthreads = number of threads reading police data files. Default 1.
+
+          rng = numpy.random.Generator used to allocate days to reports. Default global np.random state.
+
+          counts_format = 'frame' returns a counts dataframe including zero counts,
+                          'sparse' returns SparseCounts holding only non-zero counts,
+                          'tensor' returns a CountTensor, a dense (time x crime type x LSOA) array.
+                          Default frame.
+
+          cache_dir = directory to cache parsed reports and counts in. Counts are keyed by the names,
+                      sizes and modification times of the police data files along with LA_names,
+                      timeframe, aggregate and counts_format, so a warm run loads the counts
+                      (and their allocated days) of the run that cached them. Parsed reports are
+                      cached for each month folder separately. Default None (no caching).
         """
 
+        if counts_format not in ['frame', 'sparse', 'tensor']:
+            raise ValueError('Counts format passed ('+str(counts_format)+') must be one of frame, sparse or tensor.')
+
+        if counts_format != 'frame' and aggregate:
+            raise ValueError('Sparse and tensor counts are only available for LSOA level data (aggregate=False).')
+
+        if cache_dir is not None:
+
+            files_list = self.report_files(directory)
+
+            counts_cache = os.path.join(cache_dir, 'counts_'+self.cache_key(files_list, sorted(self.LA_names), timeframe,
+                                                                            aggregate, counts_format)+'.pkl')
+
+            if len(files_list) > 0 and os.path.exists(counts_cache):
+
+                print('Loading cached counts.')
+
+                return pd.read_pickle(counts_cache)
+
         print(' ')
         print('Fetching count data from police reports.')
         print('Sit back and have a brew, this may take sometime.')
         print(' ')
 
         # this initialises two class variables
-        self.initialise_data(directory=directory)
+        # only the columns needed for counts are read
+        self.initialise_data(directory=directory, usecols=self.report_columns, nthreads=nthreads, cache_dir=cache_dir)
 
-        dated_data = self.random_date_allocate(data=self.report_frame)
+        dated_data = self.random_date_allocate(data=self.report_frame, rng=rng)
 
         mut_counts_frame = self.reports_to_counts(dated_data, aggregate=aggregate)
 
         # is aggregate is not true then LSOA codes will be used by default
         # therefore add_zero_counts should be used
-        if aggregate is not True:
+        if counts_format == 'sparse':
+
+            mut_counts_frame = self.sparse_counts(mut_counts_frame, timeframe=timeframe)
+
+        elif counts_format == 'tensor':
+
+            mut_counts_frame = CountTensor.from_sparse(self.sparse_counts(mut_counts_frame, timeframe=timeframe))
+
+        elif aggregate is not True:
 
             mut_counts_frame = self.add_zero_counts(mut_counts_frame, timeframe=timeframe)
 
+        if cache_dir is not None:
+
+            pd.to_pickle(mut_counts_frame, counts_cache)
+
         return mut_counts_frame
 
-    def initialise_data(self, directory=None):
+    def append_data(self, directory, store_dir, timeframe='Week', aggregate=False, nthreads=1, rng=None):
+        """
+        Appends month folders of police data to counts stored from earlier calls, without
+        reprocessing folders already counted.
+
+        A manifest of the month folders processed is kept alongside the counts in store_dir.
+        Only folders in directory missing from the manifest are read, dated and counted, with
+        zero counts filled for their new times only, and then merged into the stored counts.
+        Folders are identified by name so changes to a folder already in the manifest are not picked up.
+
+        arguments:
+          directory = directory containing folders for each month of crime data
+
+          store_dir = directory holding the stored counts (counts.pkl) and manifest (manifest.json)
+
+          timeframe, aggregate, nthreads, rng = as get_data. timeframe, aggregate and LA_names
+                                                must match those of the stored counts.
+
+        Output: Pandas dataframe of counts for every month folder in the manifest
+        """
+
+        manifest_file = os.path.join(store_dir, 'manifest.json')
+
+        counts_file = os.path.join(store_dir, 'counts.pkl')
+
+        settings = {'LA_names' : sorted(self.LA_names), 'timeframe' : timeframe, 'aggregate' : aggregate}
+
+        if os.path.exists(manifest_file):
+
+            with open(manifest_file) as f:
+                self.manifest = json.load(f)
+
+            if {key : self.manifest[key] for key in settings} != settings:
+                raise ValueError('Counts stored in '+str(store_dir)+' were built with '+
+                                 str({key : self.manifest[key] for key in settings})+', not '+str(settings)+'.')
+
+            stored_counts = pd.read_pickle(counts_file)
+
+        else:
+
+            os.makedirs(store_dir, exist_ok=True)
+
+            self.manifest = dict(settings, folders=[])
+
+            stored_counts = None
+
+        # report files of month folders not yet processed
+        files_list = [file for file in sorted(self.report_files(directory))
+                      if os.path.basename(os.path.dirname(file)) not in self.manifest['folders']]
+
+        new_folders = sorted(set(os.path.basename(os.path.dirname(file)) for file in files_list))
+
+        print('New month folders found: ', str(len(new_folders)))
+
+        if len(new_folders) == 0:
+            return stored_counts
+
+        self.report_frame = pd.concat(self.read_report_files(files_list, usecols=self.report_columns, nthreads=nthreads),
+                                      axis=0, ignore_index=True)
+
+        dated_data = self.random_date_allocate(data=self.report_frame, rng=rng)
+
+        new_counts = self.reports_to_counts(dated_data, aggregate=aggregate)
+
+        if stored_counts is None:
+
+            if aggregate is not True:
+                new_counts = self.add_zero_counts(new_counts, timeframe=timeframe)
+
+            counts_frame = new_counts
+
+        elif aggregate is True:
+
+            counts_frame = pd.concat([stored_counts, new_counts[stored_counts.columns]], axis=0, ignore_index=True)
+
+        else:
+
+            # zero counts of the new times cover crime types seen before as well as new ones
+            new_zero_counts = self.add_zero_counts(new_counts, timeframe=timeframe,
+                                                   crime_types=stored_counts['Crime_type'].unique())
+
+            # crime types first seen in the new folders get zero counts in the stored times
+            new_crime_types = pd.Index(new_zero_counts['Crime_type'].unique()).difference(stored_counts['Crime_type'].unique())
+
+            time_cols = ['Week','datetime'] if timeframe == 'Week' else ['datetime']
+
+            stored_times = stored_counts[time_cols].drop_duplicates().reset_index(drop=True)
+
+            # (stored time x new crime type x LSOA), times referred to by their row in stored_times
+            stored_zero_index = pd.MultiIndex.from_product([stored_times.index,
+                                                            new_crime_types,
+                                                            self.LSOA_hh_counts.LSOA_code.unique()],
+                                                           names=['time','Crime_type','LSOA_code']).to_frame(index=False)
+
+            stored_zero_counts = stored_times.iloc[stored_zero_index['time'].values].reset_index(drop=True)
+
+            stored_zero_counts['Crime_type'] = stored_zero_index['Crime_type'].values
+            stored_zero_counts['LSOA_code'] = stored_zero_index['LSOA_code'].values
+            stored_zero_counts['Counts'] = 0
+
+            counts_frame = pd.concat([stored_counts,
+                                      stored_zero_counts[stored_counts.columns],
+                                      new_zero_counts[stored_counts.columns]], axis=0, ignore_index=True)
+
+        pd.to_pickle(counts_frame, counts_file)
+
+        self.manifest['folders'] = sorted(self.manifest['folders'] + new_folders)
+
+        with open(manifest_file, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+        print('Month folders appended: '+', '.join(new_folders))
+
+        return counts_frame
+
+    def initialise_data(self, directory=None, usecols=None, nthreads=1, cache_dir=None):
         """
         Function to initialise dataset
 
@@ -82,17 +250,20 @@ class Initialiser:
 
         Input: src folder
                directory: string path to directory with nested month folders with police data
+               usecols: list of columns to read from each file, e.g. Initialiser.report_columns.
+                        Default None reads all columns
+               nthreads: number of threads reading files. Default 1 reads files in turn
+               cache_dir: directory to cache the parsed reports of each month folder in. Default None
 
         """
 
-        files_list = glob.glob(str(directory)+'/*/*.csv')
+        files_list = self.report_files(directory)
 
         print('Number of data files found: ', str(len(files_list)))
 
         if directory is None:
             print('No directory passed.')
             print('Defaulting to test data.')
-            files_list = glob.glob(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_policedata/')+'*/*.csv')
 
         else:
             if len(files_list) == 0:
@@ -101,26 +272,141 @@ class Initialiser:
                 print('Glob has searched for '+directory+'/*/*.csv')
                 sys.exit(0)
 
-        files_combo = []
-
-        for file in files_list:
+        if cache_dir is None:
 
-            open_file = pd.read_csv(file)
+            files_combo = self.read_report_files(files_list, usecols=usecols, nthreads=nthreads)
 
-            files_combo.append(open_file)
+        else:
 
-        combined_files = pd.concat(files_combo, axis=0)
+            files_combo = self.cached_report_files(files_list, cache_dir, usecols=usecols, nthreads=nthreads)
 
-        combined_files.reset_index(inplace=True, drop=True)
+        combined_files = pd.concat(files_combo, axis=0, ignore_index=True)
 
         self.report_frame = combined_files
 
         return 'Data Loaded.'
 
     @classmethod
-    def random_date_allocate(cls, data):
+    def report_files(cls, directory=None):
+        """
+        Lists the police data csv files nested in month folders of directory
+
+        Input: directory: string path to directory with nested month folders with police data.
+                          Default None lists the test data
+
+        Output: list of file paths
+        """
+
+        if directory is None:
+            return glob.glob(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_policedata/')+'*/*.csv')
+
+        return glob.glob(str(directory)+'/*/*.csv')
+
+    @classmethod
+    def read_report_files(cls, files_list, usecols=None, nthreads=1):
+        """
+        Reads police data csv files
+
+        Input: files_list: list of string paths to csv files
+               usecols: list of columns to read. Default None reads all columns
+               nthreads: number of threads reading files. Default 1 reads files in turn
+
+        Output: list of Pandas dataframes in files_list order
+        """
+
+        if nthreads > 1:
+
+            # pool.map returns frames in files_list order so the result matches a serial read
+            with ThreadPool(processes=nthreads) as pool:
+
+                return pool.map(lambda file: cls.read_report_file(file, usecols=usecols), files_list)
+
+        return [cls.read_report_file(file, usecols=usecols) for file in files_list]
+
+    @classmethod
+    def cached_report_files(cls, files_list, cache_dir, usecols=None, nthreads=1):
+        """
+        Reads police data csv files through a cache of the parsed reports of each month folder.
+        A folder whose files are added, removed or modified gets a new key so only it is reread.
+
+        Input: files_list: list of string paths to csv files
+               cache_dir: directory to cache parsed reports in
+               usecols: list of columns to read. Default None reads all columns
+               nthreads: number of threads reading files. Default 1 reads files in turn
+
+        Output: list of Pandas dataframes, one per month folder
+        """
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # group files by month folder keeping the order of files_list
+        folders = {}
+
+        for file in files_list:
+            folders.setdefault(os.path.dirname(file), []).append(file)
+
+        files_combo = []
+
+        for folder_files in folders.values():
+
+            folder_cache = os.path.join(cache_dir, 'reports_'+cls.cache_key(folder_files, usecols)+'.pkl')
+
+            if os.path.exists(folder_cache):
+
+                folder_frame = pd.read_pickle(folder_cache)
+
+            else:
+
+                folder_frame = pd.concat(cls.read_report_files(folder_files, usecols=usecols, nthreads=nthreads),
+                                         axis=0, ignore_index=True)
+
+                folder_frame.to_pickle(folder_cache)
+
+            files_combo.append(folder_frame)
+
+        return files_combo
+
+    @staticmethod
+    def cache_key(files_list, *args):
+        """
+        Hash of the paths, sizes and modification times of files along with any other arguments
+
+        Input: files_list: list of string paths to files
+               args: other values the cached result depends on
+
+        Output: string hex digest
+        """
+
+        file_stats = [(os.path.abspath(file), os.path.getsize(file), os.stat(file).st_mtime_ns)
+                      for file in sorted(files_list)]
+
+        return hashlib.sha1(repr((file_stats, args)).encode()).hexdigest()
+
+    @classmethod
+    def read_report_file(cls, file, usecols=None):
+        """
+        Reads a single police data csv file
+
+        Input: file: string path to csv file
+               usecols: list of columns to read. Default None reads all columns
+
+        Output: Pandas dataframe of police reports
+        """
+
+        if usecols is None:
+            return pd.read_csv(file)
+
+        # report columns are read as strings whatever the contents of each file
+        report_dtypes = {column : str for column in usecols if column in cls.report_columns}
+
+        return pd.read_csv(file, usecols=usecols, dtype=report_dtypes)[list(usecols)]
+
+    @classmethod
+    def random_date_allocate(cls, data, rng=None):
         """
         function for randomly allocating Days or weeks to police data
+
+        rng = numpy.random.Generator used to draw days (default global np.random state)
         """
 
         try:
@@ -132,18 +418,22 @@ class Initialiser:
 
         dated_data = data.copy()
 
-        #### REFACTOR STARTS HERE
+        # each distinct Year-Month is parsed once and rows refer to it by code
+        month_codes, months = pd.factorize(dated_data['Month'])
+
+        month_starts = pd.DatetimeIndex(pd.to_datetime(months))
+
+        days_in_month = month_starts.days_in_month.values[month_codes]
+
+        # draw a random day in the month of every report in one call
+        if rng is None:
+            days = np.random.randint(1, days_in_month + 1)
+        else:
+            days = rng.integers(1, days_in_month + 1)
 
         # create a datetime column that captures month, year from Month column
-        # and adds a randomly allocated day based on year+month
-        # adds this as a new datetime column
-        dated_data['datetime'] = dated_data.apply(lambda x: pd.to_datetime(
-                                    x.Month+'/'+str(
-                                    np.random.randint(1, monthrange(
-                                                    pd.to_datetime([x.Month]).year[0],
-                                                    pd.to_datetime([x.Month]).month[0])[1] +1))
-                                                    ),
-                                                    axis=1)
+        # and adds the randomly allocated day
+        dated_data['datetime'] = month_starts.values[month_codes] + pd.to_timedelta(days - 1, unit='D').values
 
         print('Psuedo days allocated to all reports.')
 
@@ -171,83 +461,107 @@ class Initialiser:
         # if aggregate is true convert LSOA_code column to police force area name
         if aggregate == True:
 
-            # map LSOAs to police force area
-            counts_frame['LSOA_code'] = counts_frame.LSOA_code.map(
-            lambda x: self.PolForce_LSOA_map[self.PolForce_LSOA_map['LSOA Code'].isin([x])].Police_force.tolist()[0]
-            )
-
-            # group columns by Police force for crime type and date and sum the counts column
+            # map LSOAs to police force area and sum the counts column for crime type and date
             # thus aggregating data into the new police force category
-            counts_frame = counts_frame.groupby(['datetime','Crime_type','LSOA_code'])['Counts'].sum().reset_index(['datetime','Crime_type','LSOA_code'])
+            counts_frame = utils.aggregate_to_force(counts_frame, self.LSOA_force, keys=['datetime','Crime_type'])
 
         counts_frame.reset_index(inplace=True, drop=True)
 
         return counts_frame
 
-    def add_zero_counts(self, counts_frame, timeframe='Week'):
+    def add_zero_counts(self, counts_frame, timeframe='Week', crime_types=None):
         """
         Function to include of zero crime to date-allocated crime counts dataframe
+
+        Every date and crime type in counts_frame is given a row for every LSOA,
+        with Counts of 0 where no crimes were reported. For timeframe Week counts
+        are then summed within each Week number and Year-Month.
+
+        crime_types = further crime types to give rows to alongside those in counts_frame. Default None
         """
-        # test if psuedo-Weeks have been allocated
 
-        # lists for data to be appended to
-        lsoa_lst = []
-        crime_lst = []
-        counts_lst = []
-        timeres_lst = []
+        keys = ['datetime','Crime_type','LSOA_code']
 
         # function to ensure datetime is datetime dtype
-        sliced_frame = utils.validate_datetime(counts_frame.copy())
+        sliced_frame = utils.validate_datetime(counts_frame.copy(), copy=False)
 
-        for date in counts_frame['datetime'].unique():
+        counts = sliced_frame.groupby(keys)['Counts'].sum()
 
-            narrow_frame = sliced_frame[sliced_frame['datetime'].isin([date])]
+        if crime_types is None:
+            crime_types = sliced_frame['Crime_type'].unique()
+        else:
+            crime_types = pd.Index(sliced_frame['Crime_type'].unique()).union(pd.Index(crime_types), sort=False)
 
-            for crim_typ in counts_frame['Crime_type'].unique():
+        # full (date x crime type x LSOA) index, keeping any rows for LSOAs outside the LSOA list
+        full_index = pd.MultiIndex.from_product([sliced_frame['datetime'].unique(),
+                                                 crime_types,
+                                                 self.LSOA_hh_counts.LSOA_code.unique()],
+                                                names=keys)
 
-                final_nar_frame = narrow_frame[narrow_frame.Crime_type.isin([crim_typ])]
+        new_tot_counts = counts.reindex(full_index.union(counts.index), fill_value=0).reset_index()
 
-                missing_LSOA = self.LSOA_hh_counts.LSOA_code[~self.LSOA_hh_counts.LSOA_code.isin(final_nar_frame.LSOA_code)].tolist()
+        ## new section for adding Weeks
 
-                missing_len = len(missing_LSOA)
+        if timeframe == 'Week':
 
-                # add values to lists
-                # for values with one instance multiple by number of missing_LSOA to get
-                # correct dimensions
-                lsoa_lst += missing_LSOA
-                crime_lst += [crim_typ] * missing_len
-                counts_lst += [0] * missing_len
-                timeres_lst += [date] * missing_len
+            new_tot_counts = self.weekly_counts(new_tot_counts)
 
+            print('Week numbers allocated.')
 
-        missing_dataf = pd.DataFrame.from_dict({'LSOA_code' : lsoa_lst,
-                                                 'Crime_type': crime_lst,
-                                                 'datetime' : timeres_lst,
-                                                 'Counts' : counts_lst})
+        else:
 
-        new_tot_counts = pd.concat([counts_frame, missing_dataf], sort=True)
+            new_tot_counts = new_tot_counts[['Counts','Crime_type','LSOA_code','datetime']]
 
-        ## new section for adding Weeks
+        new_tot_counts.reset_index(inplace=True, drop=True)
 
-        if timeframe == 'Week':
-            # get week of the year based on month, year and psuedo-day allocated above
-            # we'll just extract it from the datetime object created above
-            new_tot_counts['Week'] = new_tot_counts.apply(lambda x: x.datetime.week, axis=1)
+        return new_tot_counts
+
+    def sparse_counts(self, counts_frame, timeframe='Week'):
+        """
+        Function to convert date-allocated crime counts to SparseCounts, which hold only
+        non-zero counts. This is equivalent to add_zero_counts without materialising the zeros.
+        """
+
+        sliced_frame = utils.validate_datetime(counts_frame.copy(), copy=False)
 
-            new_tot_counts['datetime'] = new_tot_counts.datetime.apply(lambda x: x.strftime('%Y-%m'))
+        times = pd.DataFrame({'datetime' : np.sort(sliced_frame['datetime'].unique())})
 
-            new_tot_counts = pd.DataFrame(
-                new_tot_counts.groupby(['datetime','Crime_type','LSOA_code'])['Week'].value_counts()
-                                         ).reset_index(level=['datetime','Crime_type','LSOA_code'])
+        non_zero = sliced_frame[sliced_frame['Counts'] != 0]
 
-            new_tot_counts.columns = ['datetime','Crime_type','LSOA_code', 'Counts']
+        if timeframe == 'Week':
+
+            non_zero = self.weekly_counts(non_zero)
 
-            # get datetime out of index
-            new_tot_counts.reset_index(inplace=True)
+            times = self.weekly_counts(times.assign(Crime_type='', LSOA_code='', Counts=0))[['Week','datetime']]
 
             print('Week numbers allocated.')
 
+        else:
 
-        new_tot_counts.reset_index(inplace=True, drop=True)
+            non_zero = non_zero.groupby(['datetime','Crime_type','LSOA_code'])['Counts'].sum().reset_index()
 
-        return new_tot_counts
+            non_zero = non_zero[['Counts','Crime_type','LSOA_code','datetime']]
+
+        LSOA_codes = pd.Index(self.LSOA_hh_counts.LSOA_code.unique()).union(sliced_frame['LSOA_code'].unique(), sort=False)
+
+        return SparseCounts(counts=non_zero.reset_index(drop=True),
+                            times=times.reset_index(drop=True),
+                            crime_types=sliced_frame['Crime_type'].unique(),
+                            LSOA_codes=LSOA_codes.values)
+
+    @classmethod
+    def weekly_counts(cls, counts_frame):
+        """
+        Function to sum daily counts into Week numbers within each Year-Month
+        """
+
+        # get week of the year based on month, year and psuedo-day allocated above
+        # we'll just extract it from the datetime object created above
+        week_frame = counts_frame.assign(Week=counts_frame['datetime'].dt.isocalendar().week.astype(np.int64))
+
+        # format each distinct date once rather than every row
+        dates = pd.DatetimeIndex(week_frame['datetime'].unique())
+
+        week_frame['datetime'] = week_frame['datetime'].map(pd.Series(dates.strftime('%Y-%m'), index=dates))
+
+        return week_frame.groupby(['Week','datetime','Crime_type','LSOA_code'])['Counts'].sum().reset_index()
@@ -5,6 +5,8 @@ A microsimulator class for performing the microsimulations using victim data
 import os
 import sys
 import glob
+import time
+import tempfile
 import pandas as pd
 import numpy as np
 from crime_sim_toolkit import utils
@@ -20,6 +22,10 @@ class Microsimulator():
 
     def __init__(self):
 
+        # demographic profile strings, the position of each is its integer code
+        # shared by the crime data and every population loaded
+        self.profiles = pd.Index([], dtype=str)
+
         return
 
     def load_data(self, seed_year: int, police_data_dir: str, seed_pop_dir: str,
@@ -83,6 +89,10 @@ class Microsimulator():
         A function for combining individual demographic traits into one hyphen separated
         string.
 
+        The demographic_profile column is categorical, holding integer codes into self.profiles.
+        Codes are shared between every dataframe passed to this Microsimulator, new profiles are
+        appended to self.profiles so existing codes do not change.
+
         :param: dataframe pd.DataFrame: a pandas dataframe containing demographic cols
         :param: demographic_cols list: list of strings corresponding to demographic
         trait columns, suggested preset ['sex','age','ethnicity']
@@ -93,24 +103,66 @@ class Microsimulator():
 
         try:
 
-            dataframe['demographic_profile'] = dataframe[demographic_cols].astype(str).apply('-'.join ,axis=1)
-
-            return dataframe
+            traits = dataframe[demographic_cols]
 
         except KeyError:
 
             raise KeyError('Column names passed ('+' '.join(demographic_cols)+') do not match column names in dataframe.')
 
-    def generate_probability_table(self):
+        # code each trait (missing values as -1) then each distinct combination of
+        # trait codes in order of first appearance, whatever the pandas NaN handling
+        trait_codes = [pd.factorize(traits[col])[0] + 1 for col in demographic_cols]
+
+        combo_codes = pd.factorize(np.ravel_multi_index(trait_codes, [codes.max(initial=0) + 1 for codes in trait_codes]))[0]
+
+        # join traits into a string once per combination, from its first row, rather than every row
+        first_rows = np.unique(combo_codes, return_index=True)[1]
+
+        # numpy text conversion writes missing traits as 'nan' whatever the pandas version
+        combo_traits = [np.asarray(traits[col].values[first_rows]).astype(str) for col in demographic_cols]
+
+        combo_profiles = pd.Index(['-'.join(combo) for combo in zip(*combo_traits)], dtype=str)
+
+        self.profiles = self.profiles.append(combo_profiles[~combo_profiles.isin(self.profiles)])
+
+        dataframe['demographic_profile'] = pd.Categorical.from_codes(self.profiles.get_indexer(combo_profiles)[combo_codes],
+                                                                     categories=self.profiles)
+
+        return dataframe
+
+    def profile_codes(self, profiles):
+        """
+        Integer codes of demographic profiles in self.profiles
+
+        :param: profiles pd.Series: demographic profiles, categorical from create_combined_profiles or strings
+
+        :return: np.ndarray of codes, -1 for profiles not in self.profiles
+        """
+
+        # categories of earlier profile columns are a prefix of self.profiles so their codes hold
+        if isinstance(profiles.dtype, pd.CategoricalDtype) and \
+           profiles.cat.categories.equals(self.profiles[:len(profiles.cat.categories)]):
+
+            return profiles.cat.codes.values.astype(np.int64)
+
+        return self.profiles.get_indexer(profiles.astype(str))
+
+    def generate_probability_table(self, long_table=True):
         """
         Generate a probability table of chance of specific crime description occuring
         to person of specific demographic class on a given day in a given month
 
+        The chances are held in transition_array, a dense (month x crime x profile code) float array
+        with months in self.months, crime descriptions in self.crimes and days_in_month the number
+        of days in each month. These are what the simulation reads.
+
+        :param: long_table bool: also set transition_table, the chances as a long dataframe. Default True.
         """
 
         # groupby crime_data by month, victim profile and crime description
         # then count the number of each Crime_description in those groups
-        crimes_grouped = self.crime_data.groupby(['Month','demographic_profile','Crime_description'])['Crime_description'].count()
+        crimes_grouped = self.crime_data.groupby(['Month','demographic_profile','Crime_description'],
+                                                 observed=True)['Crime_description'].count()
 
         crimes_grouped = crimes_grouped.reset_index(['Month','demographic_profile'])
 
@@ -118,22 +170,22 @@ class Microsimulator():
 
         crimes_grouped.reset_index(inplace=True)
 
-        # get counts of each demographic group in seed population
-        population_grp_counts = self.seed_population.demographic_profile.value_counts().reset_index()
-
-        population_grp_counts.columns = ['demographic_profile','demo_group_counts']
+        # order rows by profile string as well as month and crime description
+        crimes_grouped = crimes_grouped.sort_values(['Month','demographic_profile','Crime_description'],
+                                                    key=lambda col: col.astype(str)).reset_index(drop=True)
 
-        # create a dict of population-group-ids and counts of those groups
-        pop_group_dict = population_grp_counts.set_index('demographic_profile')['demo_group_counts'].to_dict()
+        # get counts of each demographic group in seed population, indexed by profile code
+        population_grp_counts = np.bincount(self.profile_codes(self.seed_population.demographic_profile),
+                                            minlength=len(self.profiles))
 
-        # map the dictionary onto the demographic profiles column in crimes dataframe to get populations
-        crimes_grouped['demo_group_counts'] = crimes_grouped.demographic_profile.map(pop_group_dict)
+        crimes_grouped['demo_group_counts'] = population_grp_counts[self.profile_codes(crimes_grouped.demographic_profile)]
 
         # assign this to a new variable
         crime_and_pop = crimes_grouped
 
         # calculate rate of crime within population for a given month and demographic group
-        crime_and_pop['crime_count_per_pop'] = crime_and_pop.crime_counts / crime_and_pop.demo_group_counts
+        # profiles absent from the seed population get NaN
+        crime_and_pop['crime_count_per_pop'] = crime_and_pop.crime_counts / crime_and_pop.demo_group_counts.replace(0, np.nan)
 
         crime_and_pop['day_in_month'] = crime_and_pop['Month'].map(utils.days_in_month_dict(crime_and_pop))
         # divide the rate of crime within population/ month/ demographic group by
@@ -143,10 +195,44 @@ class Microsimulator():
         # for rows with 0 in their demographic subpopulation we get NaNs to solve this we'll convert them all to 0
         crime_and_pop['chance_crime_per_day_demo'] = crime_and_pop['chance_crime_per_day_demo'].fillna(0)
 
+        self.months = pd.Index(crime_and_pop['Month'].unique())
+
+        self.crimes = pd.Index(crime_and_pop['Crime_description'].unique()).sort_values()
+
+        self.days_in_month = crime_and_pop.groupby('Month')['day_in_month'].first().reindex(self.months).values
+
+        # chances indexed by month, crime and profile code, zero where no crimes were recorded
+        self.transition_array = np.zeros((len(self.months), len(self.crimes), len(self.profiles)))
+
+        self.transition_array[self.months.get_indexer(crime_and_pop['Month']),
+                              self.crimes.get_indexer(crime_and_pop['Crime_description']),
+                              self.profile_codes(crime_and_pop.demographic_profile)] = crime_and_pop['chance_crime_per_day_demo'].values
+
         # set this final table as transition_table
-        self.transition_table = crime_and_pop[['Crime_description','Month','day_in_month',
-                                               'demographic_profile','crime_counts',
-                                               'chance_crime_per_day_demo']]
+        if long_table:
+            self.transition_table = crime_and_pop[['Crime_description','Month','day_in_month',
+                                                   'demographic_profile','crime_counts',
+                                                   'chance_crime_per_day_demo']]
+        else:
+            self.transition_table = None
+
+    def profile_chances(self, month: int, crime: int):
+        """
+        Daily chance of a crime in a month for every profile code, from transition_array
+
+        :param: month int: position of the month in self.months
+        :param: crime int: position of the crime description in self.crimes
+
+        :return: np.ndarray of chances of length len(self.profiles) + 1, the last entry is
+                 a zero chance for code -1 (profiles unknown to self.profiles)
+        """
+
+        # profiles added after the array was generated have no chance of crime
+        chances = np.zeros(len(self.profiles) + 1)
+
+        chances[:self.transition_array.shape[2]] = self.transition_array[month, crime]
+
+        return chances
 
 
     def load_seed_pop(self, seed_population_dir: str, demographic_cols: list):
@@ -214,13 +300,55 @@ class Microsimulator():
             raise type(e)(str(e) + '\nNo data files to load. Following files found in directory passed: '+str(file_list))
 
 
-    def run_simulation(self, future_population):
+    def run_simulation(self, future_population, engine='loop', rng=None):
         """
         A function that takes loaded transition table and a future population and
         simulates a years worth of crime based on transition table
 
         :param: future_population pd.DataFrame: dataframe of future population
+        :param: engine str: 'loop' samples each person for each crime and day in turn,
+                'binomial' samples the number of victims of each demographic profile
+                (see run_binomial_simulation). Default loop.
+        :param: rng np.random.Generator: used by the binomial engine (default a fresh np.random.default_rng())
         """
+
+        if engine == 'binomial':
+            return self.run_binomial_simulation(future_population, rng=rng)
+
+        elif engine != 'loop':
+            raise ValueError('Engine passed ('+str(engine)+') must be either loop or binomial.')
+
+        return self.loop_victims(future_population.PID.values,
+                                 self.profile_codes(future_population.demographic_profile))
+
+    def run_binomial_simulation(self, future_population, rng=None):
+        """
+        Simulates a years worth of crime as run_simulation, drawing victims by demographic profile
+        rather than person by person.
+
+        The population is grouped by demographic profile once. For each month, crime and day
+        the number of victims in each profile is drawn from a binomial of the profile size and
+        its daily chance of the crime, then that many distinct people are picked uniformly from
+        the profile. This gives the same distribution of victims as an independent draw per person.
+
+        :param: future_population pd.DataFrame: dataframe of future population
+        :param: rng np.random.Generator: used for the draws (default a fresh np.random.default_rng())
+        """
+
+        return self.binomial_victims(future_population.PID.values,
+                                     self.profile_codes(future_population.demographic_profile), rng=rng)
+
+    def loop_victims(self, PIDs, person_codes, months=None, crimes=None):
+        """
+        The loop engine of run_simulation on arrays of the future population
+
+        :param: PIDs np.ndarray: PID of each person
+        :param: person_codes np.ndarray: demographic profile code of each person (see profile_codes)
+        :param: months list: positions in self.months to simulate. Default all months
+        :param: crimes list: positions in self.crimes to simulate. Default every crime
+                with any chance of occuring in each month
+        """
+
         results = {'Month' : [],
                    'Day' : [],
                    'Person' : [],
@@ -228,49 +356,41 @@ class Microsimulator():
                    }
 
         # for each month in transition table of crime probability
-        for month in self.transition_table.Month.unique():
+        for m, month in self.simulation_months(months):
 
-            # create a specific table for the given month
-            month_trans_table = self.transition_table[self.transition_table.Month.isin([month])]
+            # for each crime with any chance of occuring in the given month
+            for c in self.simulation_crimes(m, crimes):
 
-            # for each crime in Crime_description of crime table
-            for crime in month_trans_table.Crime_description.unique():
+                crime = self.crimes[c]
 
-                # narrow table to the given crime in the given month
-                month_crime = month_trans_table[month_trans_table.Crime_description.isin([crime])]
-
-                # create a dictionary of each demographic profile and their risk
-                cond_dict = month_crime[['demographic_profile','chance_crime_per_day_demo']]\
-                            .set_index('demographic_profile')['chance_crime_per_day_demo'].to_dict()
+                # risk of each person in the future population from their demographic profile
+                person_chances = pd.Series(self.profile_chances(m, c)[person_codes])
 
                 # run a simulation for each day in the given month
-                for day in range(1, month_trans_table.day_in_month.unique()[0] + 1):
+                for day in range(1, self.days_in_month[m] + 1):
 
                     # create a boolean mask for each person in the future population
                     # this corresponds to a 1 or 0 generated from randomly sampling based on
                     # demographic probability of being victimised by the given crime
-                    # if not in that demographic return False
+                    # if no chance of the crime return False
                     # if True returns means that person was victimised
-                    bool_mask = future_population.demographic_profile.apply( \
-                                            lambda x: bool(int(np.random.choice([1,0], \
-                                                                                p=[cond_dict.get(x), \
-                                                                                1 - cond_dict.get(x)] \
-                                                                                ))) \
-                                                                                if cond_dict.get(x) is not None else False
-                                                                                )
-
-                    # slice future population array by generated boolean mask
-                    masked_victim_pop = future_population[bool_mask]
-
-                    # if that sliced array has greater than 0 rows
+                    bool_mask = person_chances.apply( \
+                                            lambda x: bool(int(np.random.choice([1,0], p=[x, 1 - x]))) \
+                                                      if x > 0 else False
+                                                      )
+
+                    # slice future population PIDs by generated boolean mask
+                    victims = PIDs[bool_mask.values]
+
+                    # if there are any victims
                     # append data to results dict
-                    if masked_victim_pop.shape[0] != 0:
-                      
+                    if len(victims) != 0:
+
                         results['Month'].append(month.split("-")[1])
 
                         results['Day'].append(day)
 
-                        results['Person'].append(masked_victim_pop.PID.tolist())
+                        results['Person'].append(victims.tolist())
 
                         results['crime'].append(crime)
 
@@ -283,26 +403,238 @@ class Microsimulator():
         # set class variable
         return results_frame
 
+    def binomial_victims(self, PIDs, person_codes, rng=None, months=None, crimes=None, groups=None):
+        """
+        The binomial engine of run_simulation on arrays of the future population
+
+        :param: PIDs np.ndarray: PID of each person
+        :param: person_codes np.ndarray: demographic profile code of each person (see profile_codes)
+        :param: rng np.random.Generator: used for the draws (default a fresh np.random.default_rng())
+        :param: months list: positions in self.months to simulate. Default all months
+        :param: crimes list: positions in self.crimes to simulate. Default every crime
+                with any chance of occuring in each month
+        :param: groups tuple: profile_groups of person_codes if already computed
+        """
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        results = {'Month' : [],
+                   'Day' : [],
+                   'Person' : [],
+                   'crime' : []
+                   }
+
+        if groups is None:
+            groups = self.profile_groups(person_codes)
+
+        profile_order, profile_sizes, profile_starts = groups
+
+        for m, month in self.simulation_months(months):
+
+            for c in self.simulation_crimes(m, crimes):
+
+                crime = self.crimes[c]
+
+                # daily chance of the crime for each profile code
+                chances = self.profile_chances(m, c)[:-1]
+
+                # number of victims in each profile on each day of the month
+                victim_counts = rng.binomial(profile_sizes, chances, size=(self.days_in_month[m], len(self.profiles)))
+
+                for day in np.flatnonzero(victim_counts.sum(axis=1)):
+
+                    victims = np.concatenate([profile_order[profile_starts[profile] + rng.choice(profile_sizes[profile],
+                                                                                              victim_counts[day, profile],
+                                                                                              replace=False)]
+                                              for profile in np.flatnonzero(victim_counts[day])])
+
+                    results['Month'].append(month.split("-")[1])
+
+                    results['Day'].append(day + 1)
+
+                    # people in population order as run_simulation
+                    results['Person'].append(PIDs[np.sort(victims)].tolist())
+
+                    results['crime'].append(crime)
+
+        results_frame = pd.DataFrame.from_dict(results)
+
+        results_frame = results_frame.explode('Person')
+
+        return results_frame
+
+    def profile_groups(self, person_codes):
+        """
+        Positions of the people of each profile, grouped by profile code. People with profiles
+        unknown to self.profiles (code -1) sort first and are never victims.
+
+        :param: person_codes np.ndarray: demographic profile code of each person
 
-    def run_mp_simulation(self):
+        :return: tuple of positions ordered by profile code, the number of people with each code
+                 and the position in that order of the first person with each code
         """
-        A method for performing the simulation using multiprocessing
-        to chunk the population dataset and run multiple simulations in
-        parrallel on each chunk of data before recombining them into the final
-        output
 
-        :param: nprocs int: number of processors avaiable to use
+        profile_order = np.argsort(person_codes, kind='stable')
+
+        profile_sizes = np.bincount(person_codes + 1, minlength=len(self.profiles) + 1)[1:]
+
+        profile_starts = np.concatenate([[0], np.cumsum(profile_sizes)]) + (person_codes == -1).sum()
+
+        return profile_order, profile_sizes, profile_starts
+
+    def simulation_months(self, months=None):
+        """
+        Positions and labels of months to simulate, default all months
         """
 
-        nprocs = mp.cpu_count()
+        if months is None:
+            months = range(len(self.months))
+
+        return [(m, self.months[m]) for m in months]
+
+    def simulation_crimes(self, month, crimes=None):
+        """
+        Positions of crimes to simulate in a month, default every crime with any chance of occuring
+        """
+
+        if crimes is None:
+            return np.flatnonzero(self.transition_array[month].any(axis=1))
+
+        return crimes
 
-        # split data into chunks based on number of processors
-        split_data = np.array_split(self.future_population, nprocs)
+    def transition_state(self):
+        """
+        A Microsimulator holding only the transition chances and profile codes needed to simulate,
+        without the crime data or populations
+        """
+
+        state = Microsimulator()
+
+        for attribute in ['profiles', 'months', 'crimes', 'days_in_month', 'transition_array']:
+            setattr(state, attribute, getattr(self, attribute))
+
+        return state
+
+    def run_mp_simulation(self, nprocs=None, engine='loop', seed=None, crime_block_size=1):
+        """
+        A method for performing the simulation using multiprocessing.
+
+        The simulation is split into many small tasks, each a month and a block of crimes
+        over the whole future population, which are handed to workers as they become free
+        so that uneven task costs do not leave workers idle. Timings of each task are kept in
+        task_timings.
+
+        The PIDs and profile codes of the future population are written once to memory-mapped
+        files which every worker attaches to, so workers share one copy of the population and
+        only receive the transition chances and the month and crimes of each task.
+
+        :param: nprocs int: number of processes to use. Default mp.cpu_count()
+        :param: engine str: 'loop' or 'binomial', see run_simulation. Default loop.
+        :param: seed int: seed (or SeedSequence) giving each task its own random stream, so results
+                for a seed do not depend on nprocs. Default None draws fresh entropy
+        :param: crime_block_size int: number of crimes simulated by each task. Default 1
+        """
 
-        results = []
+        if engine not in ['loop', 'binomial']:
+            raise ValueError('Engine passed ('+str(engine)+') must be either loop or binomial.')
 
-        pool = mp.Pool(processes=nprocs)
+        seed_seq, nprocs = utils.pool_setup(seed, nprocs)
 
-        results += pool.map(self.run_simulation, split_data)
+        PIDs = self.future_population.PID.to_numpy()
+
+        # text PIDs are stored fixed width so they can be memory-mapped
+        if PIDs.dtype == object:
+            PIDs = PIDs.astype(str)
+
+        person_codes = self.profile_codes(self.future_population.demographic_profile)
+
+        # a task for each month and block of crimes with any chance of occuring in that month
+        blocks = [(m, crimes[i:i + crime_block_size])
+                  for m in range(len(self.months))
+                  for crimes in [self.simulation_crimes(m)]
+                  for i in range(0, len(crimes), crime_block_size)]
+
+        tasks = [(task, m, crimes, engine, child_seq)
+                 for task, ((m, crimes), child_seq) in enumerate(zip(blocks, seed_seq.spawn(len(blocks))))]
+
+        with tempfile.TemporaryDirectory() as population_dir:
+
+            population = {'PID' : PIDs, 'profile_codes' : person_codes}
+
+            if engine == 'binomial':
+                population.update(zip(['profile_order', 'profile_sizes', 'profile_starts'], self.profile_groups(person_codes)))
+
+            for name, values in population.items():
+                np.save(os.path.join(population_dir, name+'.npy'), values)
+
+            with mp.Pool(processes=nprocs, initializer=Microsimulator.mp_simulation_init,
+                         initargs=(population_dir, self.transition_state())) as pool:
+
+                # collect tasks as they finish then restore task order
+                results = sorted(pool.imap_unordered(Microsimulator.mp_simulation_task, tasks), key=lambda result: result[0])
+
+        self.task_timings = pd.DataFrame({'Task' : [task[0] for task in tasks],
+                                          'Month' : [self.months[task[1]] for task in tasks],
+                                          'Crimes' : [len(task[2]) for task in tasks],
+                                          'Victims' : [len(result[1]) for result in results],
+                                          'Worker' : [result[2] for result in results],
+                                          'Seconds' : [result[3] for result in results]})
+
+        # tasks without victims are left out so they do not change the column types
+        results = [result[1] for result in results if len(result[1]) > 0]
+
+        if len(results) == 0:
+            return pd.DataFrame({'Month' : [], 'Day' : [], 'Person' : [], 'crime' : []})
 
         return pd.concat(results)
+
+    @staticmethod
+    def mp_simulation_init(population_dir, transition_state):
+        """
+        Attaches a run_mp_simulation worker to the memory-mapped population
+
+        :param: population_dir str: directory holding the population arrays as .npy files
+        :param: transition_state Microsimulator: from transition_state
+        """
+
+        Microsimulator.mp_population = {os.path.splitext(os.path.basename(file))[0] : np.load(file, mmap_mode='r')
+                                        for file in glob.glob(os.path.join(population_dir, '*.npy'))}
+
+        Microsimulator.mp_state = transition_state
+
+    @staticmethod
+    def mp_simulation_task(task):
+        """
+        Simulates crime in a month for a block of crimes over the memory-mapped population
+
+        :param: task tuple: task number, month position, crime positions, engine and
+                np.random.SeedSequence random stream of the task
+
+        :return: tuple of task number, simulated crimes, worker process id and seconds taken
+        """
+
+        task_start = time.time()
+
+        task_id, month, crimes, engine, seed_seq = task
+
+        population = Microsimulator.mp_population
+
+        if engine == 'binomial':
+
+            results_frame = Microsimulator.mp_state.binomial_victims(population['PID'], population['profile_codes'],
+                                                                     rng=np.random.default_rng(seed_seq),
+                                                                     months=[month], crimes=crimes,
+                                                                     groups=(population['profile_order'],
+                                                                             population['profile_sizes'],
+                                                                             population['profile_starts']))
+
+        else:
+
+            # the loop engine draws from the global state so reseed it for this task
+            np.random.seed(seed_seq.generate_state(1))
+
+            results_frame = Microsimulator.mp_state.loop_victims(population['PID'], population['profile_codes'],
+                                                                 months=[month], crimes=crimes)
+
+        return task_id, results_frame, os.getpid(), time.time() - task_start
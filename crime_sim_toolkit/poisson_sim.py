@@ -6,10 +6,12 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy.stats
+import multiprocessing as mp
+import time
 from sklearn.linear_model import LinearRegression as linReg
-from sklearn.metrics import mean_squared_error, median_absolute_error, mean_absolute_error
 from crime_sim_toolkit.initialiser import Initialiser
 from crime_sim_toolkit import utils
+from crime_sim_toolkit.counts import LabelledCounts, SparseCounts, CountTensor
 
 
 class Poisson_sim:
@@ -18,6 +20,9 @@ class Poisson_sim:
     Requires data from https://data.police.uk/ in data folder
     """
 
+    # slot of 29th February in the day of year slots of utils.day_of_year
+    leap_day_slot = 59
+
     def __init__(self, LA_names, directory=None, timeframe='Week', aggregate=False):
 
         self.data = Initialiser(LA_names=LA_names).get_data(directory=directory,
@@ -31,10 +36,15 @@ class Poisson_sim:
         out-of-bag sampler comparison
 
         Input: Pandas dataframe of crime counts in format from initialiser | can pass class instance
+               or SparseCounts/CountTensor
 
         Output: Pandas dataframe of crime counts for maximum year in dataset to be held as out of bag test set
+                (of the same type when passed SparseCounts or a CountTensor)
         """
 
+        if isinstance(full_data, LabelledCounts):
+            return full_data.select_years([full_data.times.datetime.max().year])
+
         original_frame = utils.validate_datetime(full_data)
 
         # identify highest year with complete counts for entire year
@@ -60,11 +70,14 @@ class Poisson_sim:
         """
 
         # ensure datetime is configured to datetime dtype
-        test_data = utils.validate_datetime(test_data)
+        test_data = cls.counts_times(cls.validate_counts(test_data, copy=False))
 
 
         oob_year = test_data.datetime.max().year
 
+        if isinstance(full_data, LabelledCounts):
+            return full_data.select_years(np.setdiff1d(full_data.times.datetime.dt.year.unique(), [oob_year]))
+
         # ensure datetime is configured to datetime dtype
         original_frame = utils.validate_datetime(full_data)
 
@@ -73,15 +86,203 @@ class Poisson_sim:
 
         return train_data
 
+    @staticmethod
+    def validate_counts(counts_data, copy=True):
+        """
+        Validates the datetime column of a counts frame (see utils.validate_datetime),
+        leaving the passed frame unaltered unless copy is False. SparseCounts and
+        CountTensors, which are validated on creation, are returned as they are.
+        """
+
+        if isinstance(counts_data, LabelledCounts):
+            return counts_data
+
+        if copy:
+            counts_data = counts_data.copy()
+
+        return utils.validate_datetime(counts_data, copy=False)
+
+    @staticmethod
+    def counts_times(counts_data):
+        """
+        Frame holding the time columns of counts data, the distinct times for SparseCounts or a CountTensor
+        """
+
+        if isinstance(counts_data, LabelledCounts):
+            return counts_data.times
+
+        return counts_data
+
+    @classmethod
+    def backtest(cls, full_data, methods=('simple',), mv_windows=(0,), engine='vectorised',
+                 min_train_years=1, seed=None, nprocs=None):
+        """
+        Rolling-origin backtest of the sampler. Every year with at least min_train_years of
+        earlier data is held out in turn, the sampler is trained on the years before it for
+        each method and mv_window, and the simulated year is scored with error_metrics.
+
+        The data is parsed once and shared by every split; each process in the pool receives
+        one copy of it rather than one per task. For the vectorised engine the slot statistics
+        of each year are also computed once (see year_slot_statistics) and each split sums
+        those of its training years, so only the holdout year's counts are sliced.
+
+        Inputs:
+            full_data = Pandas dataframe of crime counts from Initialiser
+            methods = sampling methods to test, from 'simple', 'mixed' and 'zero'
+            mv_windows = mv_window settings to test
+            engine = SimplePoission engine, 'loop' or 'vectorised'
+            min_train_years = minimum number of training years before a holdout year
+            seed = int seed (or SeedSequence) for the vectorised engine draws
+            nprocs = number of processes in the pool. Default mp.cpu_count(), 1 runs serially
+
+        Output:
+            results = Pandas dataframe with one row per holdout year, method and mv_window
+                      of error_metrics scores, training rows and run time in seconds
+        """
+
+        full_data = cls.validate_counts(full_data)
+
+        years = np.sort(cls.counts_times(full_data).datetime.dt.year.unique())
+
+        holdout_years = years[min_train_years:]
+
+        if len(holdout_years) == 0:
+            raise ValueError('Data covers '+str(len(years))+' year(s), backtesting needs more than min_train_years ('+str(min_train_years)+').')
+
+        splits = [(int(year), method, window) for year in holdout_years for method in methods for window in mv_windows]
+
+        seed_seq, nprocs = utils.pool_setup(seed, nprocs, n_tasks=len(splits))
+
+        # one stream per split so results do not depend on the number of processes
+        tasks = [split + (engine, child_seq) for split, child_seq in zip(splits, seed_seq.spawn(len(splits)))]
+
+        if engine == 'vectorised':
+            year_stats = cls.year_slot_statistics(full_data)
+        else:
+            year_stats = None
+
+        if nprocs == 1:
+
+            cls.backtest_init(full_data, year_stats)
+
+            try:
+                results = [cls.backtest_split(*task) for task in tasks]
+            finally:
+                # do not keep the data alive on the class once the backtest is done
+                cls.backtest_init(None)
+
+        else:
+
+            with mp.Pool(processes=nprocs, initializer=cls.backtest_init, initargs=(full_data, year_stats)) as pool:
+
+                results = pool.starmap(cls.backtest_split, tasks)
+
+        return pd.concat(results, ignore_index=True)
+
+    @staticmethod
+    def backtest_init(full_data, year_stats=None):
+        """
+        Pool initializer holding the parsed backtest data and the output of
+        year_slot_statistics (vectorised engine only) on the class for backtest_split
+        """
+
+        Poisson_sim.backtest_data = full_data
+
+        Poisson_sim.backtest_stats = year_stats
+
+    @staticmethod
+    def backtest_split(holdout_year, method, mv_window, engine, seed_seq):
+        """
+        Trains and scores the sampler for a single backtest split of the shared backtest data
+        """
+
+        full_data = Poisson_sim.backtest_data
+
+        if isinstance(full_data, LabelledCounts):
+            test_data = full_data.select_years([holdout_year])
+        else:
+            # take gives a new frame of the holdout rows which SimplePoission can use without copying
+            test_data = full_data.take(np.flatnonzero(full_data.datetime.dt.year.values == holdout_year))
+
+        start = time.perf_counter()
+
+        if engine == 'vectorised':
+
+            years, year_stats, times, crime_types, LSOAs = Poisson_sim.backtest_stats
+
+            slot_stats = Poisson_sim.year_range_statistics(years, year_stats, years < holdout_year,
+                                                           trend=(method == 'mixed'))
+
+            train_times = times[times['datetime'].dt.year.values < holdout_year]
+
+            time_res = 'Week' if 'Week' in times.columns else 'datetime'
+
+            targets = np.sort(Poisson_sim.counts_times(test_data)[time_res].unique())
+
+            rates_frame = Poisson_sim.slot_rates(slot_stats, crime_types, LSOAs, targets, time_res=time_res,
+                                                 method=method, mv_window=mv_window, times=train_times)
+
+            if time_res == 'Week':
+                rates_frame['datetime'] = str(holdout_year) + '-' + rates_frame['Month'].astype(str)
+
+            simulated_data = Poisson_sim.sample_rates(rates_frame, time_res=time_res,
+                                                      rng=np.random.default_rng(seed_seq))
+
+            # count rows of the training years, including rows of zeros
+            train_rows = int(np.broadcast_to(slot_stats['n'], slot_stats['total'].shape).sum())
+
+        else:
+
+            # the looped engine filters rows of the training counts so needs them sliced
+            if isinstance(full_data, LabelledCounts):
+                data_years = full_data.times.datetime.dt.year.unique()
+                train_data = full_data.select_years(data_years[data_years < holdout_year])
+            else:
+                train_data = full_data.take(np.flatnonzero(full_data.datetime.dt.year.values < holdout_year))
+
+            simulated_data = Poisson_sim.SimplePoission(train_data, test_data, method=method,
+                                                        mv_window=mv_window, engine=engine, copy=False)
+
+            train_rows = len(train_data)
+
+        run_time = time.perf_counter() - start
+
+        metrics = Poisson_sim.error_metrics(test_data, simulated_data).reset_index(drop=True)
+
+        metrics.insert(0, 'Holdout_year', holdout_year)
+        metrics.insert(1, 'Method', method)
+        metrics.insert(2, 'mv_window', mv_window)
+        metrics.insert(3, 'Train_rows', train_rows)
+
+        metrics['Seconds'] = run_time
+
+        return metrics
+
     @classmethod
-    def SimplePoission(cls, train_data, test_data, method='simple', mv_window=0):
+    def SimplePoission(cls, train_data, test_data, method='simple', mv_window=0, engine='loop',
+                       n_replicates=1, summarise=False, quantiles=(0.025, 0.975), rng=None, copy=True):
         """
         Function for generating synthetic crime count data at LSOA at timescale resolution
         based on historic data loaded from the initialiser.
 
         Inputs:
-            train_data = Pandas dataframe output from oob_train_split
-            test_data = Pandas dataframe output from out_of_bag_prep
+            train_data = Pandas dataframe (or SparseCounts/CountTensor) output from oob_train_split
+            test_data = Pandas dataframe (or SparseCounts/CountTensor) output from out_of_bag_prep
+            method = sampling method, one of 'simple', 'mixed' or 'zero'
+            mv_window = number of weeks/days either side of each date pooled when fitting
+                        (the vectorised engine also accepts a list of window sizes and
+                        returns a leading mv_window column)
+            engine = 'loop' samples each date, crime type and LSOA in turn
+                     'vectorised' fits every rate in one groupby pass and draws all counts
+                     in a single call
+            n_replicates = number of simulated replicates drawn from the one fit (vectorised only)
+            summarise = if True return the mean and quantiles of counts across replicates
+                        rather than every replicate
+            quantiles = quantiles of counts returned when summarise is True
+            rng = numpy.random.Generator used for the vectorised draws (default global np.random state)
+            copy = if False train_data and test_data frames are validated in place rather than
+                   copied and a Day_of_year column may be added to train_data. For frames
+                   that are not used elsewhere, such as backtest splits
 
         Output:
             simulated_year_frame = Pandas dataframe of simulated data based on train_data
@@ -92,9 +293,15 @@ class Poisson_sim:
         """
 
         # validate datetime columns within input data
-        oob_data = utils.validate_datetime(test_data.copy())
+        # only the times of the out-of-bag data are used
+        oob_data = cls.counts_times(cls.validate_counts(test_data, copy=copy))
+
+        historic_data = cls.validate_counts(train_data, copy=copy)
 
-        historic_data = utils.validate_datetime(train_data.copy())
+        if isinstance(historic_data, LabelledCounts) and engine != 'vectorised':
+
+            # the looped engine filters rows of counts so needs the zeros
+            historic_data = historic_data.to_frame()
 
         # method dict for sampling approaches
         # simple : fits a poisson based on all data passed
@@ -115,8 +322,31 @@ class Poisson_sim:
         else:
             time_res = 'datetime'
 
+            # integer day of year key used to look up each date's window
+            if not isinstance(historic_data, LabelledCounts):
+                historic_data['Day_of_year'] = utils.day_of_year(historic_data['datetime'])
+
         print('Time resolution set to: ', time_res)
 
+        if engine == 'vectorised':
+
+            targets = np.sort(oob_data[time_res].unique())
+
+            rates_frame = cls.fit_rates(historic_data, targets=targets, time_res=time_res,
+                                        method=method, mv_window=mv_window)
+
+            if time_res == 'Week':
+                rates_frame['datetime'] = str(year) + '-' + rates_frame['Month'].astype(str)
+
+            return cls.sample_rates(rates_frame, time_res=time_res, n_replicates=n_replicates,
+                                    summarise=summarise, quantiles=quantiles, rng=rng)
+
+        elif engine != 'loop':
+            raise ValueError('Engine passed ('+str(engine)+') must be either loop or vectorised.')
+
+        elif n_replicates != 1 or summarise:
+            raise ValueError('Multiple replicates are only supported by the vectorised engine.')
+
         # a list for all rows of data frame produced
         print('Beginning sampling.')
 
@@ -128,6 +358,14 @@ class Poisson_sim:
 
         crime_types_lst = historic_data['Crime_type'].unique()
 
+        if time_res != 'Week':
+
+            # row positions of each day of year and crime type
+            # so windows are grouped lookups rather than scans of the full history
+            day_crime_idx = historic_data.groupby(['Day_of_year','Crime_type']).indices
+
+            no_rows = np.array([], dtype=np.int64)
+
         # for each month in the range of months in oob data
         for date in np.sort(np.unique(oob_data[time_res].tolist())):
 
@@ -142,6 +380,8 @@ class Poisson_sim:
                 date_lst += cls.moving_window_datetime(datetime=date,
                                                    window=mv_window)
 
+                day_lst = np.unique(utils.day_of_year(pd.Series(date_lst)))
+
             # for each crime type
             for crim_typ in crime_types_lst:
 
@@ -159,9 +399,8 @@ class Poisson_sim:
                                              (historic_data['Crime_type'].isin([crim_typ]))]
 
                 else:
-                    frame_OI = historic_data[(historic_data[time_res].dt.day.isin([date.day for date in date_lst])) &
-                                             (historic_data[time_res].dt.month.isin([date.month for date in date_lst])) &
-                                             (historic_data['Crime_type'].isin([crim_typ]))]
+                    frame_OI = historic_data.iloc[np.sort(np.concatenate(
+                                    [day_crime_idx.get((day, crim_typ), no_rows) for day in day_lst]))]
 
                 for LSOA in frame_OI['LSOA_code'].unique():
 
@@ -217,175 +456,1467 @@ class Poisson_sim:
 
 
     @classmethod
-    def error_Reporting(cls, test_data, simulated_data):
+    def fit_rates(cls, historic_data, targets, time_res='Week', method='simple', mv_window=0):
         """
-        function for building comparison of simulated dataframe to actual out-of-bag frame
+        Fits a poisson rate for every date, crime type and LSOA at once rather than
+        filtering historic_data for each combination in turn.
+
+        Counts are reduced once to sufficient statistics for each position in the year
+        (week, or utils.day_of_year for datetimes), crime type and LSOA. Moving windows are then
+        circular rolling sums of these statistics so every window size costs the same.
+        Day windows follow the calendar, skipping the 29th February slot when no 29th February
+        falls within the window, as the looped engine does.
 
         Inputs:
-            test_data = Pandas dataframe output from out_of_bag_prep
-            simulated_year_frame = Pandas dataframe output from SimplePoission of simulated year crime counts
+            historic_data = Pandas dataframe of training counts with a datetime dtype datetime column
+                            (and optionally a precomputed Day_of_year column)
+            targets = array of Week numbers or datetimes that rates are fitted for
+            time_res = 'Week' or 'datetime'
+            method = 'simple' (mean of all counts), 'zero' (mean of non-zero counts) or
+                     'mixed' (mean of all counts plus a linear trend of counts on year)
+            mv_window = number of weeks/days either side of each target pooled when fitting,
+                        or a list of window sizes which are all fitted in one pass
 
-        Outputs:
-            comparison_frame = Pandas dataframe that shows comparison of simulated data to test_data
-                               with error scores printed and plot
+        Output:
+            rates_frame = Pandas dataframe with a row for each target, crime type and LSOA
+                          with any historic data and the fitted poisson mean in a Rate column
+                          (plus the Month of the target week when time_res is Week and the
+                          linear prediction for the year after the training data in a Trend
+                          column when method is mixed). A leading mv_window column is
+                          included when a list of window sizes is passed.
         """
 
+        slot_stats, crime_types, LSOAs = cls.slot_statistics(historic_data, time_res=time_res,
+                                                             trend=(method == 'mixed'))
 
-        test_data = utils.validate_datetime(test_data)
+        return cls.slot_rates(slot_stats, crime_types, LSOAs, targets, time_res=time_res, method=method,
+                              mv_window=mv_window, times=cls.counts_times(historic_data))
 
-        simulated_data = utils.validate_datetime(simulated_data)
-        # test for days or Weeks
-        # TODO: improve this somehow??
-        # specify value as class attribute earlier?
-        if 'Week' in simulated_data.columns:
-            time_res = 'Week'
+    @classmethod
+    def slot_rates(cls, slot_stats, crime_types, LSOAs, targets, time_res='Week', method='simple',
+                   mv_window=0, times=None):
+        """
+        The rates frame of fit_rates from the output of slot_statistics
+
+        Inputs:
+            slot_stats, crime_types, LSOAs = output of slot_statistics
+            targets, time_res, method, mv_window = as fit_rates
+            times = Pandas dataframe of the training times (Week and datetime columns)
+                    used to label target weeks with months. Week models only
+
+        Output:
+            rates_frame = Pandas dataframe as fit_rates
+        """
+
+        if method not in ['simple', 'mixed', 'zero']:
+            raise ValueError('Method passed ('+str(method)+') is not supported by the vectorised engine.')
+
+        targets = np.asarray(targets)
+
+        if np.ndim(mv_window) == 0:
+            windows = [mv_window]
         else:
-            time_res = 'datetime'
+            windows = list(mv_window)
 
-        comparison_frame = pd.concat(
-        [simulated_data.groupby([time_res,'LSOA_code'])['Counts'].sum(),
-         test_data.groupby([time_res,'LSOA_code'])['Counts'].sum()],
-                                     axis=1)
+        rates_frames = []
 
-        comparison_frame.reset_index(time_res, inplace=True)
+        for window in windows:
 
-        comparison_frame.columns = [time_res,'Pred_counts','Actual']
+            # windowed statistics for the slot of every target
+            target_stats = cls.window_statistics(slot_stats, targets, time_res=time_res, window=window)
 
-        comparison_frame['Difference'] = abs(comparison_frame.Pred_counts - comparison_frame.Actual)
+            shape = (len(targets), len(crime_types), len(LSOAs))
+
+            target_idx, crime_idx, LSOA_idx = np.nonzero(np.broadcast_to(target_stats['n'] > 0, shape))
+
+            group_stats = {name : np.broadcast_to(values, shape)[target_idx, crime_idx, LSOA_idx]
+                           for name, values in target_stats.items()}
+
+            rates, trend = cls.rates_from_stats(group_stats, method=method)
+
+            rates_frame = pd.DataFrame({time_res : targets[target_idx],
+                                        'Crime_type' : crime_types.take(crime_idx),
+                                        'LSOA_code' : LSOAs.take(LSOA_idx),
+                                        'Rate' : rates})
+
+            if trend is not None:
+                rates_frame['Trend'] = trend
+
+            if time_res == 'Week':
+                rates_frame['Month'] = rates_frame['Week'].map(cls.week_months(times, targets, window=window))
+
+            if len(windows) > 1:
+                rates_frame.insert(0, 'mv_window', window)
 
-        y_rmse = np.sqrt(mean_squared_error(comparison_frame.Actual, comparison_frame.Pred_counts))
+            rates_frames.append(rates_frame)
 
-        y_ame = mean_absolute_error(comparison_frame.Actual, comparison_frame.Pred_counts)
+        return pd.concat(rates_frames, ignore_index=True)
 
-        y_medae = median_absolute_error(comparison_frame.Actual, comparison_frame.Pred_counts)
+    @classmethod
+    def fit_model(cls, train_data, mv_window=0):
+        """
+        Function for fitting a PoissonModel to training data once so that it can be saved,
+        loaded, updated with new data and sampled from repeatedly without refitting
 
-        print('Root mean squared error of poisson sampler: ',round(y_rmse, 1))
+        Counts are taken to be zero for every time, crime type and LSOA of the training data
+        without a row, as in SparseCounts.
+
+        Inputs:
+            train_data = Pandas dataframe (or SparseCounts/CountTensor) output from oob_train_split
+            mv_window = number of weeks/days either side of each week/day pooled when fitting
 
-        print('Mean absolute error: ', round(y_ame, 1))
+        Output:
+            model = PoissonModel holding sufficient statistics for every week (or day of year),
+                    crime type and LSOA
+        """
 
-        print('Median absolute error: ', round(y_medae, 1))
+        if isinstance(train_data, CountTensor):
+            count_data = train_data.to_sparse()
 
-        # new section that prints cumulative over/undersampling
-        # perhaps more useful metric eval
-        print('-----------')
-        print('Total simulated crime events: ', comparison_frame.Pred_counts.sum())
-        print('Total crime events in holdout data: ', comparison_frame.Actual.sum())
+        elif isinstance(train_data, SparseCounts):
+            count_data = train_data
 
-        if (comparison_frame.Pred_counts.sum() - comparison_frame.Actual.sum()) > 0:
-            print('Oversampling by: ', 100 *((round(comparison_frame.Pred_counts.sum() / comparison_frame.Actual.sum(), 3) - 1)), '%')
         else:
-            print('Undersampling by: ', 100 *((round(comparison_frame.Pred_counts.sum() / comparison_frame.Actual.sum(), 3)) - 1), '%')
-        print('-------')
+            count_data = SparseCounts.from_frame(train_data)
 
-        comparison_frame[['Pred_counts','Actual']].plot.scatter(x='Actual',y='Pred_counts')
-        plt.plot([0,comparison_frame[['Pred_counts','Actual']].max().max() + 25 ],[0,comparison_frame[['Pred_counts','Actual']].max().max() + 25 ], 'k--')
+        time_res = count_data.time_res
+
+        if time_res == 'Week':
+            n_slots = 52
+            week_months = np.zeros(53, dtype=np.int64)
+        else:
+            n_slots = 366
+            week_months = None
 
-        plt.show()
+        pred_year = count_data.time_years().max() + 1
 
-        return comparison_frame
+        model = PoissonModel(time_res=time_res,
+                             crime_types=count_data.crime_types,
+                             LSOA_codes=count_data.LSOA_codes,
+                             time_stats={name : np.zeros(n_slots) for name in PoissonModel.time_stat_names},
+                             cells=np.zeros(0, dtype=np.int64),
+                             cell_stats={name : np.zeros(0) for name in PoissonModel.cell_stat_names},
+                             ref_year=pred_year,
+                             pred_year=pred_year,
+                             week_months=week_months,
+                             mv_window=mv_window)
 
-    @classmethod
-    def simple_sampler(cls, narrow_frame):
-            """
-            Simple function for data sampler
-            """
-            sim_count = scipy.stats.poisson(round(narrow_frame['Counts'].mean(), 0)).rvs()
+        model.update(count_data)
 
-            return sim_count
+        return model
 
     @classmethod
-    def mixed_sampler(cls, narrow_frame):
-            """
-            A mixed sampling method
-            It both randomly samples from a poisson model and fits a linear model
-            from count data and determines the mean of those values
-            """
+    def slot_statistics(cls, historic_data, time_res='Week', trend=False, ref_year=None):
+        """
+        Reduces training counts to dense (slot x crime x LSOA) arrays of sufficient statistics,
+        where slots are weeks (week_slot) or days of the year (utils.day_of_year)
 
-            # randomly sample from a fitted poisson model
-            poi_count = scipy.stats.poisson(round(narrow_frame['Counts'].mean(), 0)).rvs()
+        Inputs:
+            historic_data = Pandas dataframe of training counts with a datetime dtype datetime column
+            time_res = 'Week' or 'datetime'
+            trend = if True include the sums needed to fit a linear trend of counts on year
+            ref_year = year the trend sums are centred on. Default the year after the training data
 
-            # prep data for linear model
+        Output:
+            slot_stats, crime_types, LSOAs = dict of statistic arrays n, total and nz_n
+                                             (plus sum_x, sum_xx and sum_xy with trend),
+                                             Index of crime types, Index of LSOA codes.
+                                             n, sum_x and sum_xx of SparseCounts and CountTensors
+                                             are (slot x 1 x 1), see labelled_slot_statistics
+        """
 
-            # get years as the X variable
-            # TODO: correct this to account for new datetime column
-            x_Years = narrow_frame['datetime'].dt.year.values.reshape(-1, 1)
+        if isinstance(historic_data, LabelledCounts):
+            return cls.labelled_slot_statistics(historic_data, time_res=time_res, trend=trend, ref_year=ref_year)
 
-            # get counts as the Y variable
-            y_Counts = narrow_frame['Counts'].values
+        # integer codes in order of appearance preserve the
+        # crime/LSOA ordering of the looped sampler
+        crime_codes, crime_types = pd.factorize(historic_data['Crime_type'])
+        LSOA_codes, LSOAs = pd.factorize(historic_data['LSOA_code'])
 
-            # fit the model based on data
-            model = linReg().fit(x_Years, y_Counts)
+        if trend and ref_year is None:
+            ref_year = historic_data['datetime'].dt.year.max() + 1
 
-            # predict the counts for the next year
-            lin_count = round(model.predict(np.array([x_Years[-1] + 1])).item(),0)
+        hist_slots, hist_stats = cls.row_statistics(historic_data, time_res=time_res,
+                                                    ref_year=ref_year if trend else None)
 
-            # calculate the mean of linear and poisson counts
-            mixed_val = round(np.mean([lin_count, poi_count]), 0)
+        if time_res == 'Week':
+            n_slots = 52
+        else:
+            n_slots = 366
 
-            return mixed_val
+        shape = (n_slots, len(crime_types), len(LSOAs))
+
+        cells = np.ravel_multi_index((hist_slots, crime_codes, LSOA_codes), shape)
+
+        slot_stats = {name : np.bincount(cells, weights=values, minlength=np.prod(shape)).reshape(shape).astype(np.float64)
+                      for name, values in hist_stats.items()}
+
+        return slot_stats, crime_types, LSOAs
 
     @classmethod
-    def zero_sampler(cls, narrow_frame):
-            """
-            A sampling method that removes zero counts from count dataframe
-            """
-            # remove zeroes or if all zeroes set to zero
+    def labelled_slot_statistics(cls, count_data, time_res='Week', trend=False, ref_year=None):
+        """
+        slot_statistics of SparseCounts or a CountTensor. Statistics that do not depend on
+        counts (n, sum_x and sum_xx) are built from the distinct times and shared by every
+        crime type and LSOA, so are returned as (slot x 1 x 1) arrays which broadcast against
+        the rest. The rest are summed over the non-zero counts of SparseCounts, as zeros add
+        nothing to them, or along the time axis of a CountTensor.
+        """
 
-            if narrow_frame['Counts'].mean() == 0:
+        crime_types = pd.Index(count_data.crime_types)
+        LSOAs = pd.Index(count_data.LSOA_codes)
 
-                sim_count = 0
+        if trend and ref_year is None:
+            ref_year = count_data.times['datetime'].dt.year.max() + 1
 
-            else:
-                narrow_frame = narrow_frame[narrow_frame['Counts'] != 0]
+        if time_res == 'Week':
+            n_slots = 52
+        else:
+            n_slots = 366
 
-                # create a normal distribution of crime counts on the given day in a given month
-                #and randomly select a count number (round it to integer)
-                # if standard deviation is nan set value for that day at 0
-                sim_count = scipy.stats.poisson(round(narrow_frame['Counts'].mean(), 0)).rvs()
+        shape = (n_slots, len(crime_types), len(LSOAs))
 
-            return sim_count
+        time_slots, time_stats = cls.row_statistics(count_data.times.assign(Counts=0), time_res=time_res,
+                                                    ref_year=ref_year if trend else None)
 
-    @staticmethod
-    def moving_window_week(week, window=0):
+        slot_stats = {name : np.bincount(time_slots, weights=time_stats[name],
+                                         minlength=n_slots).reshape(n_slots, 1, 1).astype(np.float64)
+                      for name in ['n', 'sum_x', 'sum_xx'] if name in time_stats}
+
+        if isinstance(count_data, CountTensor):
+
+            counts = count_data.counts.astype(np.float64)
+
+            count_stats = {'total' : counts,
+                           'nz_n' : counts != 0}
+
+            if trend:
+                count_stats['sum_xy'] = counts * time_stats['sum_x'][:, None, None]
+
+            for name, values in count_stats.items():
+
+                # sum each time's (crime x LSOA) counts into its slot
+                slot_stats[name] = np.zeros(shape)
+
+                np.add.at(slot_stats[name], time_slots, values)
+
+        else:
+
+            hist_slots, hist_stats = cls.row_statistics(count_data.counts, time_res=time_res,
+                                                        ref_year=ref_year if trend else None)
+
+            cells = np.ravel_multi_index((hist_slots,
+                                          crime_types.get_indexer(count_data.counts['Crime_type']),
+                                          LSOAs.get_indexer(count_data.counts['LSOA_code'])), shape)
+
+            for name in ['total', 'nz_n', 'sum_xy']:
+
+                if name in hist_stats:
+                    slot_stats[name] = np.bincount(cells, weights=hist_stats[name],
+                                                   minlength=np.prod(shape)).reshape(shape).astype(np.float64)
+
+        return slot_stats, crime_types, LSOAs
+
+    @classmethod
+    def year_slot_statistics(cls, full_data):
         """
-        Simple method for getting week numbers adjacent to
-        a given week value
+        slot_statistics (without trend sums) of each year of counts, so that the statistics
+        of any set of years are sums along the year axis (see year_range_statistics)
+
+        Inputs:
+            full_data = Pandas dataframe (or SparseCounts/CountTensor) of counts with a
+                        datetime dtype datetime column
+
+        Output:
+            years, year_stats, times, crime_types, LSOAs = array of years, dict of statistic
+                arrays n, total and nz_n with a leading year axis, Pandas dataframe of the
+                distinct times in order of appearance, Index of crime types, Index of LSOA codes
         """
 
-        # get list of week numbers
-        week_lst = [x for x in range(1,53)]
+        if 'Week' in full_data.columns:
+            time_res = 'Week'
+            n_slots = 52
+        else:
+            time_res = 'datetime'
+            n_slots = 366
 
-        # get the index of given week
-        date_idx = week_lst.index(week)
+        if isinstance(full_data, LabelledCounts):
 
-        window_lst = [week]
+            years = np.unique(full_data.time_years())
 
-        for win in range(1, window+1):
+            per_year = [cls.labelled_slot_statistics(full_data.select_years([year]), time_res=time_res)[0]
+                        for year in years]
 
-            # get the index ahead
-            jInd = (date_idx - win) % len(week_lst)
+            year_stats = {name : np.stack([stats[name] for stats in per_year]) for name in ['n', 'total', 'nz_n']}
 
-            kInd = (date_idx + win) % len(week_lst)
+            return years, year_stats, full_data.times, pd.Index(full_data.crime_types), pd.Index(full_data.LSOA_codes)
 
-            window_lst.append(week_lst[jInd])
+        crime_codes, crime_types = pd.factorize(full_data['Crime_type'])
+        LSOA_codes, LSOAs = pd.factorize(full_data['LSOA_code'])
+        year_codes, years = pd.factorize(full_data['datetime'].dt.year, sort=True)
 
-            window_lst.append(week_lst[kInd])
+        hist_slots, hist_stats = cls.row_statistics(full_data, time_res=time_res)
 
-        return window_lst
+        shape = (len(years), n_slots, len(crime_types), len(LSOAs))
+
+        cells = np.ravel_multi_index((year_codes, hist_slots, crime_codes, LSOA_codes), shape)
+
+        year_stats = {name : np.bincount(cells, weights=values, minlength=np.prod(shape)).reshape(shape).astype(np.float64)
+                      for name, values in hist_stats.items()}
+
+        time_cols = ['Week','datetime'] if time_res == 'Week' else ['datetime']
+
+        return np.asarray(years), year_stats, full_data[time_cols].drop_duplicates(), crime_types, LSOAs
 
     @staticmethod
-    def moving_window_datetime(datetime, window=0):
+    def year_range_statistics(years, year_stats, in_range, trend=False):
         """
-        Simple method for getting week numbers adjacent to
-        a given week value
+        Sums year_slot_statistics over a selection of years. Counts of a year share its
+        (centred) year, so the trend sums follow from the sums of each year.
+
+        Inputs:
+            years, year_stats = output of year_slot_statistics
+            in_range = boolean array selecting years
+            trend = if True include the trend sums centred on the year after the last selected year
+
+        Output:
+            slot_stats = dict of statistic arrays as slot_statistics
         """
 
-        window_lst = [datetime]
+        slot_stats = {name : values[in_range].sum(axis=0) for name, values in year_stats.items()}
 
-        for window in range(1,window+1):
+        if trend:
 
-            window_lst.append(datetime + pd.DateOffset(days=window))
+            x_years = (years[in_range] - (years[in_range].max() + 1)).astype(np.float64)
 
-            window_lst.append(datetime - pd.DateOffset(days=window))
+            slot_stats['sum_x'] = np.tensordot(x_years, year_stats['n'][in_range], axes=1)
+            slot_stats['sum_xx'] = np.tensordot(x_years ** 2, year_stats['n'][in_range], axes=1)
+            slot_stats['sum_xy'] = np.tensordot(x_years, year_stats['total'][in_range], axes=1)
 
-        return window_lst
+        return slot_stats
+
+    @classmethod
+    def row_statistics(cls, historic_data, time_res='Week', ref_year=None):
+        """
+        Slot and per-row contributions to the sufficient statistics of slot_statistics
+
+        Inputs:
+            historic_data = Pandas dataframe of counts with a datetime dtype datetime column
+            time_res = 'Week' or 'datetime'
+            ref_year = year the trend sums are centred on, None leaves trend sums out
+
+        Output:
+            hist_slots, hist_stats = array of row slots, dict of arrays of row statistics
+        """
+
+        if time_res == 'Week':
+            hist_slots = cls.week_slot(historic_data['Week'].values)
+
+        elif 'Day_of_year' in historic_data.columns:
+            hist_slots = historic_data['Day_of_year'].values - 1
+
+        else:
+            hist_slots = utils.day_of_year(historic_data['datetime']) - 1
+
+        counts = historic_data['Counts'].values
+
+        hist_stats = {'n' : np.ones(len(counts)),
+                      'total' : counts,
+                      'nz_n' : counts != 0}
+
+        if ref_year is not None:
+            # years are centred on ref_year so the fitted intercept
+            # is the linear prediction for that year
+            x_years = (historic_data['datetime'].dt.year.values - ref_year).astype(np.float64)
+
+            hist_stats['sum_x'] = x_years
+            hist_stats['sum_xx'] = x_years ** 2
+            hist_stats['sum_xy'] = x_years * counts
+
+        return hist_slots, hist_stats
+
+    @classmethod
+    def week_months(cls, historic_data, targets, window=0):
+        """
+        Labels each target week with the month of the first historic row within
+        its moving window, returning a dict of week number to month
+        """
+
+        historic_data = cls.counts_times(historic_data)
+
+        month_by_week = pd.Series(historic_data['datetime'].dt.month.values, index=historic_data['Week'].values)
+        month_by_week = month_by_week[~month_by_week.index.duplicated()]
+
+        target_month = {}
+
+        for target in targets:
+
+            for week in [target] + cls.moving_window_week(week=min(int(target), 52), window=window):
+
+                if week in month_by_week.index:
+
+                    target_month[target] = month_by_week[week]
+
+                    break
+
+        return target_month
+
+    @classmethod
+    def target_slots(cls, targets, time_res='Week'):
+        """
+        Slots of an array of target Week numbers or datetimes within the arrays
+        returned by slot_statistics
+        """
+
+        if time_res == 'Week':
+            return cls.week_slot(targets)
+
+        return utils.day_of_year(pd.Series(pd.to_datetime(targets))) - 1
+
+    @staticmethod
+    def rates_from_stats(stats, method='simple'):
+        """
+        Calculates poisson rates (and linear trend predictions for the mixed method)
+        from arrays of summed sufficient statistics
+
+        Inputs:
+            stats = dict of arrays n, total and nz_n (plus sum_x, sum_xx and sum_xy for mixed)
+            method = 'simple', 'mixed' or 'zero'
+
+        Output:
+            rates, trend = array of rounded poisson means, array of rounded linear
+                           predictions or None if method is not mixed
+        """
+
+        shape = np.broadcast(stats['n'], stats['total']).shape
+
+        if method == 'zero':
+            # zero method drops zero counts before taking the mean, unless all are zero
+            rates = np.divide(stats['total'], stats['nz_n'],
+                              out=np.zeros(shape), where=stats['nz_n'] > 0)
+
+        else:
+            rates = np.divide(stats['total'], stats['n'],
+                              out=np.zeros(shape), where=stats['n'] > 0)
+
+        trend = None
+
+        if method == 'mixed':
+            trend = np.round(Poisson_sim.trend_coefficients(stats)[1], 0)
+
+        return np.round(rates, 0), trend
+
+    @staticmethod
+    def trend_coefficients(stats):
+        """
+        Closed form ordinary least squares of counts on (centred) year for every group at once.
+        Groups covering a single year get a flat line through their mean.
+
+        Inputs:
+            stats = dict of arrays n, total, sum_x, sum_xx and sum_xy
+
+        Output:
+            slopes, intercepts = arrays of fitted slopes and intercepts
+        """
+
+        n = stats['n']
+
+        x_var = n * stats['sum_xx'] - stats['sum_x'] ** 2
+        xy_cov = n * stats['sum_xy'] - stats['sum_x'] * stats['total']
+
+        shape = np.broadcast(x_var, xy_cov).shape
+
+        slopes = np.divide(xy_cov, x_var, out=np.zeros(shape), where=x_var != 0)
+
+        intercepts = np.divide(stats['total'] - slopes * stats['sum_x'], n,
+                               out=np.zeros(shape), where=n > 0)
+
+        return slopes, intercepts
+
+    @classmethod
+    def window_statistics(cls, slot_stats, targets, time_res='Week', window=0):
+        """
+        Sums statistic arrays over the window of +/- window weeks or days around every target
+
+        Week windows are circular over the 52 week slots. Day windows cover the days of year of
+        the calendar days within the window, so unless the window contains a 29th February
+        its slot is skipped and the windows are taken over the remaining 365 slots.
+
+        Inputs:
+            slot_stats = dict of (slot x crime x LSOA) arrays from slot_statistics
+            targets = array of Week numbers or datetimes
+            time_res = 'Week' or 'datetime'
+            window = number of weeks/days either side of each target
+
+        Output:
+            dict of (target x crime x LSOA) arrays
+        """
+
+        slots = cls.target_slots(targets, time_res=time_res)
+
+        if time_res == 'Week':
+            return {name : cls.circular_window_sum(values, window)[slots] for name, values in slot_stats.items()}
+
+        leap = cls.window_has_leap_day(targets, window=window)
+
+        # slots on the 365 day cycle without 29th February
+        common_slots = slots - (slots > cls.leap_day_slot)
+
+        target_stats = {}
+
+        for name, values in slot_stats.items():
+
+            target_values = np.zeros((len(slots),) + values.shape[1:])
+
+            if leap.any():
+                target_values[leap] = cls.circular_window_sum(values, window)[slots[leap]]
+
+            if not leap.all():
+                target_values[~leap] = cls.circular_window_sum(np.delete(values, cls.leap_day_slot, axis=0),
+                                                               window)[common_slots[~leap]]
+
+            target_stats[name] = target_values
+
+        return target_stats
+
+    @staticmethod
+    def leap_days_to(dates):
+        """
+        Number of 29th Februaries on or before each date of a DatetimeIndex
+        """
+
+        past_years = dates.year.values - 1
+
+        past_leap_days = past_years // 4 - past_years // 100 + past_years // 400
+
+        this_year = np.asarray(dates.is_leap_year & ((dates.month > 2) | ((dates.month == 2) & (dates.day == 29))))
+
+        return past_leap_days + this_year.astype(np.int64)
+
+    @classmethod
+    def window_has_leap_day(cls, targets, window=0):
+        """
+        Whether the +/- window days around each target datetime include a 29th February
+        """
+
+        targets = pd.DatetimeIndex(pd.to_datetime(np.asarray(targets)))
+
+        return (cls.leap_days_to(targets + pd.Timedelta(days=window))
+                - cls.leap_days_to(targets - pd.Timedelta(days=window + 1))) > 0
+
+    @staticmethod
+    def circular_window_sum(slot_array, window=0):
+        """
+        Sums an array over a circular window of +/- window slots around every slot
+        of its first axis, using cumulative sums so the cost does not depend on window
+        """
+
+        n_slots = slot_array.shape[0]
+
+        if window == 0:
+            return slot_array
+
+        # windows covering the whole cycle count each slot once
+        if 2 * window + 1 >= n_slots:
+            return np.broadcast_to(slot_array.sum(axis=0), slot_array.shape)
+
+        padded = np.concatenate([slot_array[-window:], slot_array, slot_array[:window]], axis=0)
+
+        cumulative = np.concatenate([np.zeros((1,) + slot_array.shape[1:]), np.cumsum(padded, axis=0)], axis=0)
+
+        return cumulative[2 * window + 1:] - cumulative[:-(2 * window + 1)]
+
+    @staticmethod
+    def week_slot(weeks):
+        """
+        Position of week numbers on the 52 week cycle used by moving_window_week,
+        week 53 shares the slot of week 52
+        """
+
+        return np.minimum(np.asarray(weeks, dtype=np.int64), 52) - 1
+
+    @classmethod
+    def sample_rates(cls, rates_frame, time_res='Week', n_replicates=1, summarise=False,
+                     quantiles=(0.025, 0.975), rng=None):
+        """
+        Draws simulated counts for every row of a fitted rates frame in a single
+        vectorised poisson call, optionally for many replicates at once
+
+        Inputs:
+            rates_frame = Pandas dataframe output from fit_rates (with datetime labels for Weeks)
+            time_res = 'Week' or 'datetime'
+            n_replicates = number of replicate draws of every row
+            summarise = if True return the mean and quantiles of counts across replicates
+            quantiles = quantiles of counts returned when summarise is True
+            rng = numpy.random.Generator used for the draws (default global np.random state)
+
+        Output:
+            simulated_frame = Pandas dataframe of simulated counts in SimplePoission format
+                              with a leading Replicate column when n_replicates > 1,
+                              or Counts_mean and Counts_q<quantile> columns when summarised
+        """
+
+        trend = rates_frame['Trend'].values if 'Trend' in rates_frame.columns else None
+
+        sim_counts = cls.draw_counts(rates_frame['Rate'].values, trend=trend,
+                                     n_replicates=n_replicates, rng=rng)
+
+        return cls.replicates_to_frame(rates_frame, sim_counts, time_res=time_res,
+                                       summarise=summarise, quantiles=quantiles)
+
+    @classmethod
+    def ParallelEnsemble(cls, train_data, test_data, n_replicates, method='simple', mv_window=0,
+                         seed=None, nprocs=None, block_size=10, summarise=False, quantiles=(0.025, 0.975)):
+        """
+        Function for simulating a large ensemble of replicates across a pool of processes.
+
+        Rates are fitted once and replicates are drawn in fixed size blocks, each block
+        from its own numpy.random.Generator spawned from a single SeedSequence. As blocks
+        do not depend on the number of processes the output for a given seed is identical
+        whatever the number of processes used.
+
+        Inputs:
+            train_data = Pandas dataframe output from oob_train_split
+            test_data = Pandas dataframe output from out_of_bag_prep
+            n_replicates = number of simulated replicates
+            method = sampling method, one of 'simple', 'mixed' or 'zero'
+            mv_window = number of weeks/days either side of each date pooled when fitting
+            seed = int seed (or SeedSequence) for the ensemble, None draws fresh entropy
+            nprocs = number of processes in the pool. Default mp.cpu_count(), 1 runs serially
+            block_size = number of replicates drawn by each task
+            summarise = if True return the mean and quantiles of counts across replicates
+            quantiles = quantiles of counts returned when summarise is True
+
+        Output:
+            simulated_frame = Pandas dataframe in the format of sample_rates
+        """
+
+        oob_data = cls.counts_times(cls.validate_counts(test_data))
+
+        historic_data = cls.validate_counts(train_data)
+
+        if 'Week' in historic_data.columns:
+            time_res = 'Week'
+        else:
+            time_res = 'datetime'
+
+        targets = np.sort(oob_data[time_res].unique())
+
+        rates_frame = cls.fit_rates(historic_data, targets=targets, time_res=time_res,
+                                    method=method, mv_window=mv_window)
+
+        if time_res == 'Week':
+            rates_frame['datetime'] = str(oob_data.datetime.max().year) + '-' + rates_frame['Month'].astype(str)
+
+        rates = rates_frame['Rate'].values
+
+        trend = rates_frame['Trend'].values if 'Trend' in rates_frame.columns else None
+
+        # the number and size of blocks depends only on n_replicates and block_size
+        block_sizes = [min(block_size, n_replicates - start) for start in range(0, n_replicates, block_size)]
+
+        seed_seq, nprocs = utils.pool_setup(seed, nprocs, n_tasks=len(block_sizes))
+
+        tasks = list(zip(block_sizes, seed_seq.spawn(len(block_sizes))))
+
+        if nprocs == 1:
+
+            cls.ensemble_init(rates, trend)
+
+            try:
+                sim_blocks = [cls.draw_block(*task) for task in tasks]
+            finally:
+                cls.ensemble_init(None, None)
+
+        else:
+
+            # rates and trend are sent once to each process rather than with every task
+            with mp.Pool(processes=nprocs, initializer=cls.ensemble_init, initargs=(rates, trend)) as pool:
+
+                # map returns blocks in task order regardless of which process drew them
+                sim_blocks = pool.starmap(cls.draw_block, tasks)
+
+        sim_counts = np.concatenate(sim_blocks, axis=0)
+
+        return cls.replicates_to_frame(rates_frame, sim_counts, time_res=time_res,
+                                       summarise=summarise, quantiles=quantiles)
+
+    @staticmethod
+    def draw_counts(rates, trend=None, n_replicates=1, rng=None):
+        """
+        Draws a (replicate x row) block of poisson counts from an array of rates,
+        blending them with linear trend predictions when these are passed (mixed method)
+        """
+
+        if rng is None:
+            rng = np.random
+
+        sim_counts = rng.poisson(rates, size=(n_replicates, len(rates)))
+
+        if trend is not None:
+            # blend the linear predictions with the poisson draws
+            sim_counts = np.round((trend + sim_counts) / 2, 0)
+
+        return sim_counts
+
+    @staticmethod
+    def ensemble_init(rates, trend):
+        """
+        Pool initializer holding the ensemble rates and trend on the class for draw_block
+        """
+
+        Poisson_sim.ensemble_rates = rates
+
+        Poisson_sim.ensemble_trend = trend
+
+    @staticmethod
+    def draw_block(n_replicates, seed_seq):
+        """
+        Process pool task for ParallelEnsemble drawing one block of replicates of the
+        shared ensemble rates from a Generator seeded by its own SeedSequence
+        """
+
+        return Poisson_sim.draw_counts(Poisson_sim.ensemble_rates, trend=Poisson_sim.ensemble_trend,
+                                       n_replicates=n_replicates, rng=np.random.default_rng(seed_seq))
+
+    @classmethod
+    def replicates_to_frame(cls, rates_frame, sim_counts, time_res='Week', summarise=False, quantiles=(0.025, 0.975)):
+        """
+        Builds the output frame of sample_rates from a (replicate x row) block of
+        simulated counts for the rows of rates_frame
+        """
+
+        if time_res == 'Week':
+            key_cols = ['Week','datetime','Crime_type']
+        else:
+            key_cols = ['datetime','Crime_type']
+
+        # rates fitted for several window sizes at once
+        if 'mv_window' in rates_frame.columns:
+            key_cols = ['mv_window'] + key_cols
+
+        key_frame = rates_frame[key_cols + ['LSOA_code']].reset_index(drop=True)
+
+        n_replicates = sim_counts.shape[0]
+
+        if summarise:
+
+            simulated_frame = key_frame
+
+            simulated_frame['Counts_mean'] = sim_counts.mean(axis=0)
+
+            for quantile, values in zip(quantiles, np.quantile(sim_counts, quantiles, axis=0)):
+
+                simulated_frame['Counts_q'+str(quantile)] = values
+
+            return simulated_frame
+
+        if n_replicates == 1:
+
+            simulated_frame = key_frame
+
+            simulated_frame['Counts'] = sim_counts[0]
+
+            return simulated_frame[key_cols + ['Counts','LSOA_code']]
+
+        # long frame of every replicate, replicate by replicate
+        simulated_frame = key_frame.take(np.tile(np.arange(len(key_frame)), n_replicates)).reset_index(drop=True)
+
+        simulated_frame['Replicate'] = np.repeat(np.arange(n_replicates), len(key_frame))
+
+        simulated_frame['Counts'] = sim_counts.ravel()
+
+        return simulated_frame[['Replicate'] + key_cols + ['Counts','LSOA_code']]
+
+    @classmethod
+    def error_Reporting(cls, test_data, simulated_data, plot=True, verbose=True):
+        """
+        function for building comparison of simulated dataframe to actual out-of-bag frame
+
+        Inputs:
+            test_data = Pandas dataframe (or SparseCounts/CountTensor) output from out_of_bag_prep
+            simulated_year_frame = Pandas dataframe output from SimplePoission of simulated year crime counts
+            plot = if True plot simulated against actual counts (see plot_comparison)
+            verbose = if True print error scores and over/undersampling
+
+        Outputs:
+            comparison_frame = Pandas dataframe that shows comparison of simulated data to test_data
+                               with error scores printed and plot
+        """
+
+
+        # comparison frames hold every time period and LSOA so zeros are materialised
+        if isinstance(test_data, LabelledCounts):
+            test_data = test_data.to_frame()
+
+        test_data = utils.validate_datetime(test_data)
+
+        simulated_data = utils.validate_datetime(simulated_data)
+        # test for days or Weeks
+        # TODO: improve this somehow??
+        # specify value as class attribute earlier?
+        if 'Week' in simulated_data.columns:
+            time_res = 'Week'
+        else:
+            time_res = 'datetime'
+
+        comparison_frame = pd.concat(
+        [simulated_data.groupby([time_res,'LSOA_code'])['Counts'].sum(),
+         test_data.groupby([time_res,'LSOA_code'])['Counts'].sum()],
+                                     axis=1)
+
+        comparison_frame.reset_index(time_res, inplace=True)
+
+        comparison_frame.columns = [time_res,'Pred_counts','Actual']
+
+        comparison_frame['Difference'] = abs(comparison_frame.Pred_counts - comparison_frame.Actual)
+
+        if verbose:
+
+            scores = cls.error_scores(comparison_frame.Actual.values, comparison_frame.Pred_counts.values)
+
+            print('Root mean squared error of poisson sampler: ',round(scores['RMSE'][0], 1))
+
+            print('Mean absolute error: ', round(scores['MAE'][0], 1))
+
+            print('Median absolute error: ', round(scores['MedAE'][0], 1))
+
+            # new section that prints cumulative over/undersampling
+            # perhaps more useful metric eval
+            print('-----------')
+            print('Total simulated crime events: ', comparison_frame.Pred_counts.sum())
+            print('Total crime events in holdout data: ', comparison_frame.Actual.sum())
+
+            if (comparison_frame.Pred_counts.sum() - comparison_frame.Actual.sum()) > 0:
+                print('Oversampling by: ', 100 *((round(comparison_frame.Pred_counts.sum() / comparison_frame.Actual.sum(), 3) - 1)), '%')
+            else:
+                print('Undersampling by: ', 100 *((round(comparison_frame.Pred_counts.sum() / comparison_frame.Actual.sum(), 3)) - 1), '%')
+            print('-------')
+
+        if plot:
+
+            cls.plot_comparison(comparison_frame)
+
+            plt.show()
+
+        return comparison_frame
+
+    @classmethod
+    def error_metrics(cls, test_data, simulated_data):
+        """
+        Headless error scores of simulated counts against actual out-of-bag counts, computed
+        for every replicate at once. Counts are summed by time period and LSOA before scoring,
+        as in error_Reporting, with periods missing from either side counted as zero.
+
+        Inputs:
+            test_data = Pandas dataframe (or SparseCounts/CountTensor) output from out_of_bag_prep
+            simulated_data = Pandas dataframe output from SimplePoission or ParallelEnsemble,
+                             which may include a Replicate column, or a list of such dataframes
+                             (one per replicate)
+
+        Outputs:
+            metrics = Pandas dataframe indexed by Replicate with columns RMSE, MAE, MedAE,
+                      Simulated_total, Actual_total and Sampling_pct (percentage over (+) or
+                      under (-) sampling of total counts)
+        """
+
+        if isinstance(simulated_data, (list, tuple)):
+            simulated_data = pd.concat([frame.assign(Replicate=replicate)
+                                        for replicate, frame in enumerate(simulated_data)],
+                                       ignore_index=True)
+
+        if isinstance(test_data, CountTensor):
+            test_data = test_data.to_sparse()
+
+        if isinstance(test_data, SparseCounts):
+            sparse_test = test_data
+            test_data = test_data.counts
+        else:
+            sparse_test = None
+
+        if 'Week' in simulated_data.columns:
+            time_res = 'Week'
+        else:
+            time_res = 'datetime'
+            # compare dates whatever form the datetime columns arrive in
+            test_data = test_data.assign(datetime=pd.to_datetime(test_data['datetime']))
+            simulated_data = simulated_data.assign(datetime=pd.to_datetime(simulated_data['datetime']))
+
+        if 'Replicate' not in simulated_data.columns:
+            simulated_data = simulated_data.assign(Replicate=0)
+
+        actual = test_data.groupby([time_res,'LSOA_code'])['Counts'].sum()
+
+        simulated = simulated_data.groupby(['Replicate', time_res, 'LSOA_code'])['Counts'].sum().unstack('Replicate')
+
+        keys = actual.index.union(simulated.index)
+
+        if sparse_test is not None:
+            # every time period and LSOA is scored, including those with no crimes
+            keys = keys.union(pd.MultiIndex.from_product([sparse_test.times[time_res].unique(), sparse_test.LSOA_codes],
+                                                         names=[time_res,'LSOA_code']))
+
+        # (replicates x time periods and LSOAs) array of simulated counts
+        sim_counts = simulated.reindex(keys).fillna(0).values.T
+
+        scores = cls.error_scores(actual.reindex(keys).fillna(0).values, sim_counts)
+
+        metrics = pd.DataFrame(scores, index=pd.Index(simulated.columns, name='Replicate'))
+
+        return metrics
+
+    @staticmethod
+    def error_scores(actual, simulated):
+        """
+        Vectorised error scores of simulated against actual counts
+
+        Inputs:
+            actual = array of actual counts
+            simulated = array of simulated counts matching actual, or a
+                        (replicates x counts) array of simulated counts
+
+        Outputs:
+            scores = dict of arrays (one value per replicate) RMSE, MAE, MedAE,
+                     Simulated_total, Actual_total and Sampling_pct
+        """
+
+        actual = np.asarray(actual, dtype=np.float64)
+
+        simulated = np.atleast_2d(np.asarray(simulated, dtype=np.float64))
+
+        abs_error = np.abs(simulated - actual)
+
+        sim_total = simulated.sum(axis=1)
+
+        actual_total = np.full(len(simulated), actual.sum())
+
+        return {'RMSE' : np.sqrt(np.mean(abs_error ** 2, axis=1)),
+                'MAE' : np.mean(abs_error, axis=1),
+                'MedAE' : np.median(abs_error, axis=1),
+                'Simulated_total' : sim_total,
+                'Actual_total' : actual_total,
+                'Sampling_pct' : 100 * (sim_total / actual_total - 1)}
+
+    @staticmethod
+    def plot_comparison(comparison_frame):
+        """
+        Scatter plot of simulated against actual counts with a line of perfect agreement
+
+        Inputs:
+            comparison_frame = Pandas dataframe output from error_Reporting
+
+        Outputs:
+            ax = matplotlib axes of the plot
+        """
+
+        max_count = comparison_frame[['Pred_counts','Actual']].max().max() + 25
+
+        ax = comparison_frame[['Pred_counts','Actual']].plot.scatter(x='Actual',y='Pred_counts')
+
+        ax.plot([0, max_count], [0, max_count], 'k--')
+
+        return ax
+
+    @classmethod
+    def simple_sampler(cls, narrow_frame):
+            """
+            Simple function for data sampler
+            """
+            sim_count = scipy.stats.poisson(round(narrow_frame['Counts'].mean(), 0)).rvs()
+
+            return sim_count
+
+    @classmethod
+    def mixed_sampler(cls, narrow_frame):
+            """
+            A mixed sampling method
+            It both randomly samples from a poisson model and fits a linear model
+            from count data and determines the mean of those values
+            """
+
+            # randomly sample from a fitted poisson model
+            poi_count = scipy.stats.poisson(round(narrow_frame['Counts'].mean(), 0)).rvs()
+
+            # prep data for linear model
+
+            # get years as the X variable
+            # TODO: correct this to account for new datetime column
+            x_Years = narrow_frame['datetime'].dt.year.values.reshape(-1, 1)
+
+            # get counts as the Y variable
+            y_Counts = narrow_frame['Counts'].values
+
+            # fit the model based on data
+            model = linReg().fit(x_Years, y_Counts)
+
+            # predict the counts for the next year
+            lin_count = round(model.predict(np.array([x_Years[-1] + 1])).item(),0)
+
+            # calculate the mean of linear and poisson counts
+            mixed_val = round(np.mean([lin_count, poi_count]), 0)
+
+            return mixed_val
+
+    @classmethod
+    def zero_sampler(cls, narrow_frame):
+            """
+            A sampling method that removes zero counts from count dataframe
+            """
+            # remove zeroes or if all zeroes set to zero
+
+            if narrow_frame['Counts'].mean() == 0:
+
+                sim_count = 0
+
+            else:
+                narrow_frame = narrow_frame[narrow_frame['Counts'] != 0]
+
+                # create a normal distribution of crime counts on the given day in a given month
+                #and randomly select a count number (round it to integer)
+                # if standard deviation is nan set value for that day at 0
+                sim_count = scipy.stats.poisson(round(narrow_frame['Counts'].mean(), 0)).rvs()
+
+            return sim_count
+
+    @staticmethod
+    def moving_window_week(week, window=0):
+        """
+        Simple method for getting week numbers adjacent to
+        a given week value
+        """
+
+        # get list of week numbers
+        week_lst = [x for x in range(1,53)]
+
+        # get the index of given week
+        date_idx = week_lst.index(week)
+
+        window_lst = [week]
+
+        for win in range(1, window+1):
+
+            # get the index ahead
+            jInd = (date_idx - win) % len(week_lst)
+
+            kInd = (date_idx + win) % len(week_lst)
+
+            window_lst.append(week_lst[jInd])
+
+            window_lst.append(week_lst[kInd])
+
+        return window_lst
+
+    @staticmethod
+    def moving_window_datetime(datetime, window=0):
+        """
+        Simple method for getting week numbers adjacent to
+        a given week value
+        """
+
+        window_lst = [datetime]
+
+        for window in range(1,window+1):
+
+            window_lst.append(datetime + pd.DateOffset(days=window))
+
+            window_lst.append(datetime - pd.DateOffset(days=window))
+
+        return window_lst
+
+
+class PoissonModel:
+    """
+    A fitted poisson sampler produced by Poisson_sim.fit_model
+
+    Holds additive sufficient statistics for each slot (the weeks or days of the year),
+    crime type and LSOA. Every crime type and LSOA has a count at every time seen, zero
+    where no crimes were reported, so statistics that do not depend on counts are held
+    once per slot and the rest only for the (slot, crime type, LSOA) cells with non-zero
+    counts. Rates for each method are derived from these on demand so counts can be
+    sampled for any target dates without refitting, and new months of counts can be
+    folded in with update. Models can be saved to and loaded from .npz files.
+    """
+
+    time_stat_names = ['n', 'sum_x', 'sum_xx']
+
+    cell_stat_names = ['total', 'nz_n', 'sum_xy']
+
+    def __init__(self, time_res, crime_types, LSOA_codes, time_stats, cells, cell_stats,
+                 ref_year, pred_year, week_months=None, mv_window=0):
+        """
+        Inputs:
+            time_res = 'Week' or 'datetime'
+            crime_types = array of crime type labels of the crime axis
+            LSOA_codes = array of LSOA labels of the LSOA axis
+            time_stats = dict of arrays of the number of times (n) and year sums (sum_x, sum_xx)
+                         for each slot
+            cells = array of sorted flat indices into the (slot x crime type x LSOA) axes
+                    of each cell with non-zero counts
+            cell_stats = dict of arrays of summed counts (total), non-zero counts (nz_n)
+                         and year by count sums (sum_xy) for each cell
+            ref_year = year the year sums are centred on
+            pred_year = year after the training data, which trends are predicted for
+            week_months = array of the month of the first row seen for each week number 1-53,
+                          0 where unseen (Week models only)
+            mv_window = number of weeks/days either side of each slot pooled for rates
+        """
+
+        self.time_res = time_res
+        self.crime_types = crime_types
+        self.LSOA_codes = LSOA_codes
+        self.time_stats = time_stats
+        self.cells = cells
+        self.cell_stats = cell_stats
+        self.ref_year = ref_year
+        self.pred_year = pred_year
+        self.week_months = week_months
+        self.mv_window = mv_window
+
+        self.fitted = None
+
+    def fit(self, leap=True):
+        """
+        Derives rates, non-zero rates, trend slopes and trend predictions for pred_year
+        for every slot, crime type and LSOA from the windowed sufficient statistics.
+        Results are kept until the model is updated.
+
+        Inputs:
+            leap = for day models, fit windows over all 366 days of year (for windows
+                   containing a 29th February) or over the 365 days without 29th February
+                   (see Poisson_sim.window_statistics). Ignored by Week models.
+
+        Output:
+            fitted = dict of arrays rates, nonzero_rates, slopes, intercepts and observed
+        """
+
+        leap = leap or self.time_res == 'Week'
+
+        if self.fitted is None:
+            self.fitted = {}
+
+        if leap not in self.fitted:
+
+            shape = self.cell_shape()
+
+            # time statistics broadcast against the (slot x crime x LSOA) cell statistics
+            slot_stats = {name : values.reshape(shape[0], 1, 1) for name, values in self.time_stats.items()}
+
+            for name, values in self.cell_stats.items():
+
+                slot_stats[name] = np.zeros(np.prod(shape))
+
+                slot_stats[name][self.cells] = values
+
+                slot_stats[name] = slot_stats[name].reshape(shape)
+
+            if not leap:
+                slot_stats = {name : np.delete(values, Poisson_sim.leap_day_slot, axis=0)
+                              for name, values in slot_stats.items()}
+
+            window_stats = {name : Poisson_sim.circular_window_sum(values, self.mv_window)
+                            for name, values in slot_stats.items()}
+
+            slopes, intercepts = Poisson_sim.trend_coefficients(window_stats)
+
+            self.fitted[leap] = {'rates' : Poisson_sim.rates_from_stats(window_stats, method='simple')[0],
+                                 'nonzero_rates' : Poisson_sim.rates_from_stats(window_stats, method='zero')[0],
+                                 'slopes' : slopes,
+                                 'intercepts' : intercepts + slopes * (self.pred_year - self.ref_year),
+                                 'observed' : np.broadcast_to(window_stats['n'] > 0, slopes.shape)}
+
+        return self.fitted[leap]
+
+    def target_fits(self, targets):
+        """
+        Fitted arrays of fit for the window around each target
+
+        Inputs:
+            targets = array of Week numbers or datetimes
+
+        Output:
+            target_fits = dict of (target x crime x LSOA) arrays rates, nonzero_rates, slopes,
+                          intercepts and observed
+        """
+
+        slots = Poisson_sim.target_slots(targets, time_res=self.time_res)
+
+        if self.time_res == 'Week':
+            return {name : values[slots] for name, values in self.fit().items()}
+
+        leap = Poisson_sim.window_has_leap_day(targets, window=self.mv_window)
+
+        # slots on the 365 day cycle without 29th February
+        common_slots = slots - (slots > Poisson_sim.leap_day_slot)
+
+        target_fits = {}
+
+        for is_leap, mask, fit_slots in [(True, leap, slots), (False, ~leap, common_slots)]:
+
+            if not mask.any():
+                continue
+
+            for name, values in self.fit(leap=is_leap).items():
+
+                if name not in target_fits:
+                    target_fits[name] = np.zeros((len(slots),) + values.shape[1:], dtype=values.dtype)
+
+                target_fits[name][mask] = values[fit_slots[mask]]
+
+        return target_fits
+
+    def rates_frame(self, targets, method='simple'):
+        """
+        Builds a frame of fitted rates for every target, crime type and LSOA with training data
+
+        Inputs:
+            targets = array of Week numbers or datetimes
+            method = 'simple', 'mixed' or 'zero'
+
+        Output:
+            rates_frame = Pandas dataframe in the format of Poisson_sim.fit_rates
+        """
+
+        targets = np.asarray(targets)
+
+        fitted = self.target_fits(targets)
+
+        methods_dict = {'simple' : fitted['rates'],
+                        'mixed' : fitted['rates'],
+                        'zero' : fitted['nonzero_rates']}
+
+        if method not in methods_dict:
+            raise ValueError('Method passed ('+str(method)+') must be one of simple, mixed or zero.')
+
+        target_idx, crime_idx, LSOA_idx = np.nonzero(fitted['observed'])
+
+        cells = (target_idx, crime_idx, LSOA_idx)
+
+        rates_frame = pd.DataFrame({self.time_res : targets[target_idx],
+                                    'Crime_type' : self.crime_types[crime_idx],
+                                    'LSOA_code' : self.LSOA_codes[LSOA_idx],
+                                    'Rate' : methods_dict[method][cells]})
+
+        if method == 'mixed':
+            rates_frame['Trend'] = np.round(fitted['intercepts'][cells], 0)
+
+        if self.time_res == 'Week':
+
+            # label each target week with the month of the first week seen within its window
+            target_month = {}
+
+            for target in np.unique(targets):
+
+                for week in [target] + Poisson_sim.moving_window_week(week=min(int(target), 52), window=self.mv_window):
+
+                    if self.week_months[week - 1] != 0:
+
+                        target_month[target] = self.week_months[week - 1]
+
+                        break
+
+            rates_frame['Month'] = rates_frame['Week'].map(target_month)
+
+        return rates_frame
+
+    def sample(self, targets, method='simple', year=None, n_replicates=1, summarise=False,
+               quantiles=(0.025, 0.975), rng=None):
+        """
+        Samples simulated counts for every target, crime type and LSOA from the fitted rates
+
+        Inputs:
+            targets = array of Week numbers or datetimes
+            method = 'simple', 'mixed' or 'zero'
+            year = year used to label simulated weeks. Default the year after the training data
+            n_replicates = number of replicate draws
+            summarise = if True return the mean and quantiles of counts across replicates
+            quantiles = quantiles of counts returned when summarise is True
+            rng = numpy.random.Generator for the draws (default global np.random state)
+
+        Output:
+            simulated_frame = Pandas dataframe in the format of Poisson_sim.sample_rates
+        """
+
+        rates_frame = self.rates_frame(targets, method=method)
+
+        if self.time_res == 'Week':
+
+            if year is None:
+                year = self.pred_year
+
+            rates_frame['datetime'] = str(year) + '-' + rates_frame['Month'].astype(str)
+
+        return Poisson_sim.sample_rates(rates_frame, time_res=self.time_res, n_replicates=n_replicates,
+                                        summarise=summarise, quantiles=quantiles, rng=rng)
+
+    def update(self, counts_data):
+        """
+        Folds new counts (e.g. a new month of data from the Initialiser) into the model.
+        Only the new times and non-zero counts are processed, so the cost is proportional
+        to their size. Counts must not already be included in the model.
+
+        Inputs:
+            counts_data = Pandas dataframe (or SparseCounts/CountTensor) of counts in the
+                          format the model was fitted on
+        """
+
+        if isinstance(counts_data, CountTensor):
+            counts_data = counts_data.to_sparse()
+
+        elif not isinstance(counts_data, SparseCounts):
+            counts_data = SparseCounts.from_frame(counts_data)
+
+        old_shape = self.cell_shape()
+
+        # grow the model axes for unseen crime types and LSOAs
+        self.crime_types = self.extend_axis(self.crime_types, counts_data.crime_types)
+
+        self.LSOA_codes = self.extend_axis(self.LSOA_codes, counts_data.LSOA_codes)
+
+        shape = self.cell_shape()
+
+        if shape != old_shape:
+            # codes are unchanged so the cells keep their order on the larger axes
+            self.cells = np.ravel_multi_index(np.unravel_index(self.cells, old_shape), shape)
+
+        n_slots = shape[0]
+
+        time_slots, time_stats = Poisson_sim.row_statistics(counts_data.times.assign(Counts=0),
+                                                            time_res=self.time_res, ref_year=self.ref_year)
+
+        for name in self.time_stat_names:
+
+            self.time_stats[name] = self.time_stats[name] + np.bincount(time_slots, weights=time_stats[name],
+                                                                        minlength=n_slots)
+
+        hist_slots, hist_stats = Poisson_sim.row_statistics(counts_data.counts, time_res=self.time_res,
+                                                            ref_year=self.ref_year)
+
+        new_cells = np.ravel_multi_index((np.asarray(hist_slots, dtype=np.int64),
+                                          pd.Index(self.crime_types).get_indexer(counts_data.counts['Crime_type']),
+                                          pd.Index(self.LSOA_codes).get_indexer(counts_data.counts['LSOA_code'])),
+                                         shape)
+
+        self.add_cells(new_cells, {name : hist_stats[name] for name in self.cell_stat_names})
+
+        self.pred_year = max(self.pred_year, counts_data.time_years().max() + 1)
+
+        if self.time_res == 'Week':
+
+            new_months = counts_data.times.drop_duplicates('Week')
+
+            for week, month in zip(new_months['Week'], new_months['datetime'].dt.month):
+
+                if self.week_months[week - 1] == 0:
+                    self.week_months[week - 1] = month
+
+        self.fitted = None
+
+    def cell_shape(self):
+        """
+        Shape of the (slot x crime type x LSOA) axes the cells index
+        """
+
+        return (len(self.time_stats['n']), len(self.crime_types), len(self.LSOA_codes))
+
+    def add_cells(self, new_cells, new_stats):
+        """
+        Adds statistics of (slot, crime type, LSOA) cells to the cell statistics. Cells
+        already held are found by binary search and summed into, unseen cells are inserted
+        in order, so held cells are neither re-sorted nor re-summed.
+
+        Inputs:
+            new_cells = array of flat indices into the axes of cell_shape, may repeat
+            new_stats = dict of arrays of cell statistics for each of new_cells
+        """
+
+        # sum repeated cells of the new counts (e.g. the days of one week slot)
+        new_cells, new_idx = np.unique(new_cells, return_inverse=True)
+
+        new_stats = {name : np.bincount(new_idx, weights=new_stats[name], minlength=len(new_cells))
+                     for name in self.cell_stat_names}
+
+        positions = np.searchsorted(self.cells, new_cells)
+
+        held = positions < len(self.cells)
+        held[held] = self.cells[positions[held]] == new_cells[held]
+
+        for name in self.cell_stat_names:
+            np.add.at(self.cell_stats[name], positions[held], new_stats[name][held])
+
+        unseen = ~held
+
+        if unseen.any():
+
+            self.cells = np.insert(self.cells, positions[unseen], new_cells[unseen])
+
+            self.cell_stats = {name : np.insert(values, positions[unseen], new_stats[name][unseen])
+                               for name, values in self.cell_stats.items()}
+
+    @staticmethod
+    def extend_axis(labels, new_labels):
+        """
+        Appends labels of new_labels unseen on an axis of labels to the axis. Codes of
+        existing labels, which index the cells, are unchanged. Labels are held as objects
+        so longer new labels are not cut to the width of fixed width text labels.
+
+        Inputs:
+            labels = array of labels of the axis
+            new_labels = array of labels, some of which may be unseen
+
+        Output:
+            labels = object array of the extended labels
+        """
+
+        unseen = pd.Index(pd.unique(np.asarray(new_labels))).difference(labels, sort=False)
+
+        if len(unseen) == 0:
+            return labels
+
+        return np.concatenate([np.asarray(labels).astype(object), unseen.values.astype(object)])
+
+    def save(self, path):
+        """
+        Save the model to a compressed .npz file
+
+        Inputs:
+            path = file path to write to
+        """
+
+        np.savez_compressed(path,
+                            time_res=np.array(self.time_res),
+                            ref_year=np.array(self.ref_year),
+                            pred_year=np.array(self.pred_year),
+                            mv_window=np.array(self.mv_window),
+                            crime_types=np.asarray(self.crime_types, dtype=str),
+                            LSOA_codes=np.asarray(self.LSOA_codes, dtype=str),
+                            week_months=np.array([]) if self.week_months is None else self.week_months,
+                            cells=self.cells,
+                            **self.time_stats,
+                            **self.cell_stats)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a model saved with PoissonModel.save
+
+        Inputs:
+            path = path to a .npz file
+
+        Output:
+            model = PoissonModel
+        """
+
+        with np.load(path) as model_file:
+
+            time_res = str(model_file['time_res'])
+
+            return cls(time_res=time_res,
+                       crime_types=model_file['crime_types'].astype(object),
+                       LSOA_codes=model_file['LSOA_codes'].astype(object),
+                       time_stats={name : model_file[name] for name in cls.time_stat_names},
+                       cells=model_file['cells'],
+                       cell_stats={name : model_file[name] for name in cls.cell_stat_names},
+                       ref_year=int(model_file['ref_year']),
+                       pred_year=int(model_file['pred_year']),
+                       week_months=model_file['week_months'] if time_res == 'Week' else None,
+                       mv_window=int(model_file['mv_window']))
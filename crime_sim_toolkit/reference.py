@@ -0,0 +1,223 @@
+"""
+Registry of the reference tables shipped in crime_sim_toolkit/src
+
+Each table is loaded, parsed and indexed the first time it is asked for and the
+same object is returned on every later call within the process. Tables are shared
+so should be treated as read-only; copy before altering them.
+
+Tables are read from precompiled binary (.npz) copies of the csv files where these
+exist and were built from the csv as it is now (matched by size and sha1 digest),
+otherwise from the csv. The binary copies are built with:
+
+    python -m crime_sim_toolkit.reference
+"""
+
+import os
+import hashlib
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import pkg_resources
+
+resource_package = 'crime_sim_toolkit'
+
+# csv path of each reference table and the read_csv arguments used to parse it
+tables = {'LSOA_population' : ('src/LSOA_data/census_2011_population_hh.csv', {'thousands' : ','}),
+          'police_force_LSOA' : ('src/LSOA_data/PoliceforceLSOA.csv', {'index_col' : 0}),
+          'offence_descriptions' : ('src/prc-pfa-201718_new.csv', {'index_col' : 0})}
+
+
+def binary_path(csv_path):
+    """
+    Path of the precompiled binary copy of a csv file
+    """
+
+    return os.path.splitext(csv_path)[0] + '.npz'
+
+def source_digest(csv_path):
+    """
+    Size and sha1 digest of a csv file, stored in its binary copy to tell whether
+    the copy was built from the csv as it is now
+    """
+
+    sha1 = hashlib.sha1()
+
+    with open(csv_path, 'rb') as csv_file:
+        for block in iter(lambda: csv_file.read(1 << 20), b''):
+            sha1.update(block)
+
+    return str(os.path.getsize(csv_path)) + ':' + sha1.hexdigest()
+
+def binary_source(npz_path):
+    """
+    Source digest stored in a binary copy, None for copies saved without one
+    """
+
+    with np.load(npz_path, allow_pickle=False) as arrays:
+
+        if '__source__' not in arrays.files:
+            return None
+
+        return str(arrays['__source__'])
+
+def read_table(table):
+    """
+    Reads a reference table from its binary copy if this was built from the current csv,
+    else parses the csv
+
+    Inputs: table: name of the table in tables
+
+    Output: Pandas dataframe
+    """
+
+    csv_path = pkg_resources.resource_filename(resource_package, tables[table][0])
+
+    npz_path = binary_path(csv_path)
+
+    if os.path.exists(npz_path) and (not os.path.exists(csv_path) or
+                                     binary_source(npz_path) == source_digest(csv_path)):
+        return load_binary(npz_path)
+
+    return pd.read_csv(csv_path, **tables[table][1])
+
+def save_binary(frame, npz_path, source=None):
+    """
+    Saves a dataframe as a compressed .npz with one array per column. Text columns are
+    stored as integer codes into an array of their distinct values, missing values as -1.
+    source is the digest of the csv the frame was read from, see source_digest.
+    """
+
+    arrays = {'__columns__' : np.array(frame.columns, dtype=str),
+              '__index__' : frame.index.values}
+
+    if source is not None:
+        arrays['__source__'] = np.array(source)
+
+    for i, column in enumerate(frame.columns):
+
+        values = frame[column]
+
+        if pd.api.types.is_numeric_dtype(values):
+            arrays['values_'+str(i)] = values.values
+        else:
+            codes, uniques = pd.factorize(values)
+            arrays['codes_'+str(i)] = codes.astype(np.int32)
+            arrays['uniques_'+str(i)] = np.array(uniques, dtype=str)
+
+    np.savez_compressed(npz_path, **arrays)
+
+def load_binary(npz_path):
+    """
+    Loads a dataframe saved by save_binary
+    """
+
+    with np.load(npz_path, allow_pickle=False) as arrays:
+
+        columns = {}
+
+        for i, column in enumerate(arrays['__columns__'].tolist()):
+
+            if 'values_'+str(i) in arrays.files:
+                columns[column] = arrays['values_'+str(i)]
+            else:
+                codes = arrays['codes_'+str(i)]
+                # decode into an object array of text with NaN where the code is -1,
+                # as read_csv gives
+                uniques = np.append(arrays['uniques_'+str(i)].astype(object), np.nan)
+                columns[column] = uniques[codes]
+
+        return pd.DataFrame(columns, index=arrays['__index__'])
+
+def build_tables():
+    """
+    Builds binary copies of every reference table whose csv is present
+    """
+
+    for table, (path, read_args) in tables.items():
+
+        csv_path = pkg_resources.resource_filename(resource_package, path)
+
+        if not os.path.exists(csv_path):
+            print('No csv found for '+table+', skipping.')
+            continue
+
+        save_binary(pd.read_csv(csv_path, **read_args), binary_path(csv_path),
+                    source=source_digest(csv_path))
+
+        print('Built '+binary_path(csv_path))
+
+@lru_cache(maxsize=None)
+def LSOA_population():
+    """
+    2011 census population and household counts by LSOA with the local authority and MSOA
+    of each LSOA. Persons and Households are parsed as integers.
+    """
+
+    return read_table('LSOA_population')
+
+@lru_cache(maxsize=None)
+def LSOA_local_authority():
+    """
+    Local authority code of each LSOA, a Pandas series indexed by LSOA code
+    """
+
+    LSOA_pop = LSOA_population()
+
+    return pd.Series(LSOA_pop['Local authority code'].values, index=LSOA_pop['LSOA Code'].values)
+
+@lru_cache(maxsize=None)
+def police_force_LSOA():
+    """
+    Region, local authority, MSOA and police force of each LSOA
+    """
+
+    return read_table('police_force_LSOA')
+
+@lru_cache(maxsize=None)
+def LSOA_force():
+    """
+    Police force of each LSOA, see build_LSOA_force
+    """
+
+    return build_LSOA_force(police_force_LSOA())
+
+def build_LSOA_force(LSOA_pf_reference):
+    """
+    Builds a lookup of police force by LSOA code from a PoliceforceLSOA frame, a Pandas series
+    indexed by LSOA code holding police forces as a categorical. Integer codes of the forces
+    (in sorted order) are available from .cat.codes.
+    """
+
+    return pd.Series(pd.Categorical(LSOA_pf_reference['Police_force'].values),
+                     index=pd.Index(LSOA_pf_reference['LSOA Code'].values, name='LSOA_code'),
+                     name='Police_force')
+
+@lru_cache(maxsize=None)
+def offence_descriptions():
+    """
+    Police recorded crime offence counts by police force, offence description and Police UK category
+    """
+
+    return read_table('offence_descriptions')
+
+@lru_cache(maxsize=None)
+def offence_categories():
+    """
+    Dictionary of lower case Police UK crime category by lower case offence description,
+    including anti-social behaviour (which is not present in the offence tables)
+    """
+
+    descriptions_reference = offence_descriptions()
+
+    reference_dict = descriptions_reference[['Policeuk_Cat','Offence_Description']].set_index('Offence_Description')['Policeuk_Cat'].to_dict()
+
+    # convert to lowercase
+    reference_dict = dict((idx.lower(), val.lower()) for idx, val in reference_dict.items())
+
+    # manually add in anti-social behaviour (as not present in reference table)
+    reference_dict['anti-social behaviour'] = 'anti-social behaviour'
+
+    return reference_dict
+
+if __name__ == '__main__':
+    build_tables()
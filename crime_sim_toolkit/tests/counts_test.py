@@ -0,0 +1,98 @@
+"""
+a test file for count containers
+"""
+import unittest
+import numpy as np
+import pandas as pd
+from crime_sim_toolkit import utils
+from crime_sim_toolkit.counts import SparseCounts, CountTensor
+import pkg_resources
+
+
+# Could be any dot-separated package/module name or a "Requirement"
+resource_package = 'crime_sim_toolkit'
+
+class Test(unittest.TestCase):
+
+    def test_sparse_counts(self):
+        """
+        Test sparse counts hold only non-zero counts and rebuild the full counts frame
+        """
+
+        self.data = utils.validate_datetime(pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_traindata.csv')))
+
+        self.sparse = SparseCounts.from_frame(self.data)
+
+        self.assertTrue((self.sparse.counts.Counts > 0).all())
+
+        self.assertEqual(len(self.sparse), len(self.data))
+
+        self.assertEqual(self.sparse.time_res, 'Week')
+
+        keys = ['Week','datetime','Crime_type','LSOA_code']
+
+        pd.testing.assert_frame_equal(self.sparse.to_frame().sort_values(keys).reset_index(drop=True),
+                                      self.data.sort_values(keys).reset_index(drop=True)[self.sparse.columns],
+                                      check_dtype=False)
+
+    def test_sparse_select_years(self):
+        """
+        Test selecting years keeps the times and counts of those years only
+        """
+
+        self.data = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_trainDay_data.csv'))
+
+        self.sparse = SparseCounts.from_frame(self.data, LSOA_codes=['E01011229'])
+
+        self.test = self.sparse.select_years([2017])
+
+        self.assertEqual(self.test.times.datetime.dt.year.unique().tolist(), [2017])
+
+        self.assertEqual(self.test.counts.datetime.dt.year.unique().tolist(), [2017])
+
+        self.assertEqual(self.test.LSOA_codes.tolist(), self.sparse.LSOA_codes.tolist())
+
+        self.assertEqual(self.test.to_frame().Counts.sum(), self.test.counts.Counts.sum())
+
+    def test_count_tensor(self):
+        """
+        Test count tensors convert to and from counts frames and sparse counts
+        """
+
+        self.data = utils.validate_datetime(pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_traindata.csv')))
+
+        self.tensor = CountTensor.from_frame(self.data, LSOA_codes=['E01011229'])
+
+        self.assertEqual(self.tensor.counts.shape, (len(self.tensor.times), self.data.Crime_type.nunique(), 2))
+
+        self.assertEqual(self.tensor.counts.sum(), self.data.Counts.sum())
+
+        keys = ['Week','datetime','Crime_type','LSOA_code']
+
+        pd.testing.assert_frame_equal(self.tensor.to_frame().sort_values(keys).reset_index(drop=True),
+                                      self.tensor.to_sparse().to_frame().sort_values(keys).reset_index(drop=True))
+
+        self.assertEqual(self.tensor.to_sparse().counts.Counts.sum(), self.data.Counts.sum())
+
+        with self.assertRaises(ValueError):
+            CountTensor(self.tensor.counts[:, :, :1], self.tensor.times, self.tensor.crime_types, self.tensor.LSOA_codes)
+
+    def test_count_tensor_aggregate(self):
+        """
+        Test LSOA counts sum into groups along the LSOA axis
+        """
+
+        self.times = pd.DataFrame({'datetime' : pd.to_datetime(['2017-01-01', '2017-01-02'])})
+
+        self.tensor = CountTensor(np.arange(12).reshape(2, 2, 3), self.times, ['A', 'B'], ['L1', 'L2', 'L3'])
+
+        self.test = self.tensor.aggregate(['F1', 'F2', 'F1'])
+
+        self.assertEqual(self.test.LSOA_codes.tolist(), ['F1', 'F2'])
+
+        self.assertEqual(self.test.counts[:, :, 0].tolist(), [[2, 8], [14, 20]])
+
+        self.assertEqual(self.test.counts[:, :, 1].tolist(), [[1, 4], [7, 10]])
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
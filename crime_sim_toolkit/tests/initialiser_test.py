@@ -4,7 +4,10 @@ testing Initialiser class in crime_sim_toolkit
 
 import os
 import json
+import shutil
+import tempfile
 import unittest
+import numpy as np
 import pandas as pd
 import crime_sim_toolkit.initialiser as Initialiser
 import pkg_resources
@@ -45,6 +48,25 @@ class Test(unittest.TestCase):
 
         self.assertFalse(self.init.random_date_allocate(data=self.dataFalse))
 
+    def test_random_date_rng(self):
+        """
+        test random days fall within each report month and are reproducible from a Generator
+        """
+
+        self.data = pd.DataFrame({'Month' : ['2016-02'] * 500 + ['2017-02'] * 500 + ['2017-12'] * 500})
+
+        self.test1 = self.init.random_date_allocate(data=self.data, rng=np.random.default_rng(7))
+
+        self.test2 = self.init.random_date_allocate(data=self.data, rng=np.random.default_rng(7))
+
+        self.assertTrue(self.test1.datetime.equals(self.test2.datetime))
+
+        self.assertTrue((self.test1.datetime.dt.strftime('%Y-%m') == self.data.Month).all())
+
+        self.assertEqual(self.test1.groupby('Month').datetime.max().dt.day.tolist(), [29, 28, 31])
+
+        self.assertEqual(self.test1.datetime.dt.day.min(), 1)
+
     def test_initalise_data(self):
 
         """
@@ -64,6 +86,17 @@ class Test(unittest.TestCase):
 
         self.assertEqual(self.init.LSOA_hh_counts.columns.tolist(), col_head2)
 
+    def test_initialise_data_parallel(self):
+        """
+        Test threaded, column projected loading matches the full report frame
+        """
+
+        self.full_frame = self.init.report_frame
+
+        self.init.initialise_data(directory=None, usecols=self.init.report_columns, nthreads=2)
+
+        pd.testing.assert_frame_equal(self.init.report_frame, self.full_frame[self.init.report_columns])
+
     def test_reports_2_counts(self):
         """
         Test to check the reports to counts converter works
@@ -116,6 +149,131 @@ class Test(unittest.TestCase):
 
         self.assertEqual(len(self.test[self.test.datetime == '2017-01-07'].LSOA_code.unique()), 1388)
 
+        self.test_week = self.init.add_zero_counts(self.data, timeframe='Week')
+
+        self.assertEqual(self.test_week.columns.tolist(), ['Week','datetime','Crime_type','LSOA_code','Counts'])
+
+        # weekly counts are the sum of daily counts
+        self.assertEqual(self.test_week.Counts.sum(), self.data.Counts.sum())
+
+        self.assertEqual(sorted(self.test_week.Week.unique().tolist()), [1, 2, 4, 5])
+
+    def test_get_data_sparse(self):
+        """
+        Test sparse counts from get_data hold the same counts as the counts frame
+        """
+
+        self.data = self.init.get_data(timeframe='Week', rng=np.random.default_rng(2))
+
+        self.sparse = self.init.get_data(timeframe='Week', rng=np.random.default_rng(2), counts_format='sparse')
+
+        self.assertEqual(len(self.sparse), len(self.data))
+
+        self.assertEqual(len(self.sparse.counts), (self.data.Counts != 0).sum())
+
+        keys = ['Week','datetime','Crime_type','LSOA_code']
+
+        self.full = self.sparse.to_frame()
+
+        self.full['datetime'] = self.full.datetime.dt.strftime('%Y-%m')
+
+        pd.testing.assert_frame_equal(self.full.sort_values(keys).reset_index(drop=True),
+                                      self.data.sort_values(keys).reset_index(drop=True),
+                                      check_dtype=False)
+
+        with self.assertRaises(ValueError):
+            self.init.get_data(aggregate=True, counts_format='sparse')
+
+    def test_get_data_cache(self):
+        """
+        Test cached counts are reloaded and a modified month folder is reread alone
+        """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            self.data_dir = os.path.join(tmp_dir, 'policedata')
+
+            self.cache_dir = os.path.join(tmp_dir, 'cache')
+
+            shutil.copytree(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_policedata'), self.data_dir)
+
+            self.data = self.init.get_data(directory=self.data_dir, rng=np.random.default_rng(1), cache_dir=self.cache_dir)
+
+            self.report_caches = [file for file in os.listdir(self.cache_dir) if file.startswith('reports_')]
+
+            self.assertEqual(len(self.report_caches), len(set(map(os.path.dirname, self.init.report_files(self.data_dir)))))
+
+            # a different rng would allocate different days unless the counts are loaded from cache
+            self.test = self.init.get_data(directory=self.data_dir, rng=np.random.default_rng(2), cache_dir=self.cache_dir)
+
+            pd.testing.assert_frame_equal(self.test, self.data)
+
+            # modify one month folder, only its parsed reports are cached again
+            self.month_file = self.init.report_files(self.data_dir)[0]
+
+            os.utime(self.month_file, ns=(0, os.stat(self.month_file).st_mtime_ns + 10**9))
+
+            self.test = self.init.get_data(directory=self.data_dir, rng=np.random.default_rng(1), cache_dir=self.cache_dir)
+
+            self.new_caches = [file for file in os.listdir(self.cache_dir)
+                               if file.startswith('reports_') and file not in self.report_caches]
+
+            self.assertEqual(len(self.new_caches), 1)
+
+            self.assertEqual(self.test.Counts.sum(), self.data.Counts.sum())
+
+    def test_append_data(self):
+        """
+        Test appending month folders matches counting all folders at once
+        """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            self.data_dir = os.path.join(tmp_dir, 'policedata')
+
+            self.store_dir = os.path.join(tmp_dir, 'store')
+
+            self.months = sorted(os.listdir(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_policedata')))
+
+            self.months.remove('.gitkeep')
+
+            for month in self.months[:-1]:
+                shutil.copytree(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_policedata/'+month),
+                                os.path.join(self.data_dir, month))
+
+            # leave a crime type out of the stored months so it is first seen in the appended month
+            for file in self.init.report_files(self.data_dir):
+                self.reports = pd.read_csv(file)
+                self.reports[self.reports['Crime type'] != 'Drugs'].to_csv(file, index=False)
+
+            self.init.append_data(self.data_dir, self.store_dir)
+
+            self.assertEqual(self.init.manifest['folders'], self.months[:-1])
+
+            self.assertFalse((self.init.append_data(self.data_dir, self.store_dir).Crime_type == 'Drugs').any())
+
+            shutil.copytree(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_policedata/'+self.months[-1]),
+                            os.path.join(self.data_dir, self.months[-1]))
+
+            self.test = self.init.append_data(self.data_dir, self.store_dir)
+
+            self.assertEqual(self.init.manifest['folders'], self.months)
+
+            self.full = self.init.get_data(directory=self.data_dir)
+
+            keys = ['Week','datetime','Crime_type','LSOA_code']
+
+            pd.testing.assert_frame_equal(self.test[keys].sort_values(keys).reset_index(drop=True),
+                                          self.full[keys].sort_values(keys).reset_index(drop=True))
+
+            self.assertEqual(self.test.Counts.sum(), self.full.Counts.sum())
+
+            # no new folders returns the stored counts
+            pd.testing.assert_frame_equal(self.init.append_data(self.data_dir, self.store_dir), self.test)
+
+            with self.assertRaises(ValueError):
+                self.init.append_data(self.data_dir, self.store_dir, timeframe='Day')
+
     def test_new_data_load(self):
         """
         Test new data load function
@@ -82,6 +82,45 @@ class Test(unittest.TestCase):
             self.test_sim.create_combined_profiles(dataframe = self.loaded_sim.crime_data,
                                                    demographic_cols = ['name','age','ethnicity'])
 
+        # missing traits ahead of later combinations keep their own profile
+        self.traits = pd.DataFrame({'sex' : [1, np.nan, 2, 1, np.nan],
+                                    'age' : [30, 40, 30, 30, 40],
+                                    'ethnicity' : [1, 1, 1, 1, 2]})
+
+        self.traits = self.test_sim.create_combined_profiles(dataframe = self.traits,
+                                                             demographic_cols = ['sex','age','ethnicity'])
+
+        self.assertEqual(self.traits.demographic_profile.astype(str).tolist(),
+                         ['1.0-30-1', 'nan-40-1', '2.0-30-1', '1.0-30-1', 'nan-40-2'])
+
+
+    def test_profile_codes(self):
+        """
+        Test demographic profiles share integer codes across crime and population data
+        """
+
+        self.crime_profiles = self.running_sim.crime_data.demographic_profile
+
+        self.pop_profiles = self.running_sim.future_population.demographic_profile
+
+        self.assertTrue(isinstance(self.crime_profiles.dtype, pd.CategoricalDtype))
+
+        # codes map back to the joined string of each profile
+        self.assertEqual(self.running_sim.profiles[self.running_sim.profile_codes(self.crime_profiles)].tolist(),
+                         self.running_sim.crime_data[['sex','age','ethnicity']].astype(str).apply('-'.join, axis=1).tolist())
+
+        # profiles in both frames have the same code in each
+        self.shared = set(self.crime_profiles.astype(str)) & set(self.pop_profiles.astype(str))
+
+        self.assertTrue(len(self.shared) > 0)
+
+        self.crime_codes = dict(zip(self.crime_profiles.astype(str), self.running_sim.profile_codes(self.crime_profiles)))
+
+        self.pop_codes = dict(zip(self.pop_profiles.astype(str), self.running_sim.profile_codes(self.pop_profiles)))
+
+        self.assertTrue(all(self.crime_codes[profile] == self.pop_codes[profile] for profile in self.shared))
+
+        self.assertEqual(self.running_sim.profile_codes(pd.Series(['not-a-profile'])).tolist(), [-1])
 
     def test_load_seed_pop(self):
         """
@@ -127,6 +166,33 @@ class Test(unittest.TestCase):
 
         self.assertAlmostEqual(self.loaded_sim.transition_table.chance_crime_per_day_demo[10], 0.000512, places=4)
 
+    def test_transition_array(self):
+        """
+        Test the dense transition array holds the chances of the long transition table
+        """
+
+        self.table = self.running_sim.transition_table
+
+        self.array = self.running_sim.transition_array
+
+        self.assertEqual(self.array.shape, (len(self.running_sim.months), len(self.running_sim.crimes), len(self.running_sim.profiles)))
+
+        self.chances = self.array[self.running_sim.months.get_indexer(self.table.Month),
+                                  self.running_sim.crimes.get_indexer(self.table.Crime_description),
+                                  self.running_sim.profile_codes(self.table.demographic_profile)]
+
+        np.testing.assert_array_equal(self.chances, self.table.chance_crime_per_day_demo.values)
+
+        self.assertAlmostEqual(self.array.sum(), self.table.chance_crime_per_day_demo.sum())
+
+        self.assertEqual(self.running_sim.days_in_month.tolist(), [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+        self.loaded_sim.generate_probability_table(long_table=False)
+
+        self.assertIsNone(self.loaded_sim.transition_table)
+
+        np.testing.assert_array_equal(self.loaded_sim.transition_array, self.array[:, :, :self.loaded_sim.transition_array.shape[2]])
+
     def test_run_simulation(self):
         """
         A test for the run_simulator function
@@ -158,6 +224,65 @@ class Test(unittest.TestCase):
 
         np.testing.assert_allclose(seed_crimes.to_numpy(), sim_crimes.to_numpy(), atol=1.5, rtol=1.0)
 
+    def test_run_binomial_simulation(self):
+        """
+        A test for the binomial engine of run_simulation
+        """
+
+        sim_run01 = self.running_sim.run_simulation(future_population = self.running_sim.future_population,
+                                                    engine='binomial', rng=np.random.default_rng(1))
+
+        self.assertEqual(sim_run01.columns.tolist(), ['Month','Day','Person','crime'])
+
+        self.assertTrue(sim_run01.Person.isin(self.running_sim.future_population.PID).all())
+
+        # a person is victim of a given crime at most once a day
+        self.assertFalse(sim_run01.duplicated().any())
+
+        seed_crime_prop = self.running_sim.crime_data.shape[0] / self.running_sim.seed_population.shape[0]
+
+        sim_crime_prop = sim_run01.shape[0] / self.running_sim.future_population.shape[0]
+
+        np.testing.assert_allclose(sim_crime_prop, seed_crime_prop, rtol=0.01, atol=0.05)
+
+        sim_run02 = self.running_sim.run_simulation(future_population = self.running_sim.future_population,
+                                                    engine='binomial', rng=np.random.default_rng(1))
+
+        pd.testing.assert_frame_equal(sim_run01, sim_run02)
+
+        with self.assertRaises(ValueError):
+            self.running_sim.run_simulation(future_population = self.running_sim.future_population, engine='vectorised')
+
+    def test_run_mp_simulation(self):
+        """
+        A test for running the simulation over chunks of the population in parallel
+        """
+
+        sim_run01 = self.running_sim.run_mp_simulation(nprocs=2, engine='binomial', seed=1)
+
+        self.assertEqual(sim_run01.columns.tolist(), ['Month','Day','Person','crime'])
+
+        self.assertTrue(sim_run01.Person.isin(self.running_sim.future_population.PID).all())
+
+        seed_crime_prop = self.running_sim.crime_data.shape[0] / self.running_sim.seed_population.shape[0]
+
+        sim_crime_prop = sim_run01.shape[0] / self.running_sim.future_population.shape[0]
+
+        np.testing.assert_allclose(sim_crime_prop, seed_crime_prop, rtol=0.01, atol=0.05)
+
+        # tasks have their own random streams so the same seed gives the same simulation for any nprocs
+        pd.testing.assert_frame_equal(sim_run01, self.running_sim.run_mp_simulation(nprocs=1, engine='binomial', seed=1))
+
+        self.running_sim.run_mp_simulation(nprocs=2, engine='binomial', seed=1, crime_block_size=5)
+
+        self.timings = self.running_sim.task_timings
+
+        self.assertEqual(self.timings.columns.tolist(), ['Task','Month','Crimes','Victims','Worker','Seconds'])
+
+        self.assertEqual(self.timings.Crimes.sum(), (self.running_sim.transition_array.any(axis=2)).sum())
+
+        self.assertTrue((self.timings.Crimes <= 5).all())
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
@@ -0,0 +1,93 @@
+"""
+a test file for the reference table registry
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from crime_sim_toolkit import reference, utils
+
+
+class Test(unittest.TestCase):
+
+    def test_tables_cached(self):
+        """
+        Test each reference table is loaded once and shared between calls
+        """
+
+        self.assertIs(reference.LSOA_population(), reference.LSOA_population())
+
+        self.assertIs(reference.police_force_LSOA(), reference.police_force_LSOA())
+
+        self.assertIs(utils.LSOA_force_index(), reference.LSOA_force())
+
+    def test_LSOA_population(self):
+        """
+        Test census counts are parsed as integers
+        """
+
+        self.LSOA_pop = reference.LSOA_population()
+
+        self.assertTrue(np.issubdtype(self.LSOA_pop['Persons'].dtype, np.integer))
+
+        self.assertTrue(np.issubdtype(self.LSOA_pop['Households'].dtype, np.integer))
+
+    def test_LSOA_force(self):
+        """
+        Test the police force lookup matches the PoliceforceLSOA table
+        """
+
+        self.LSOA_pf = reference.police_force_LSOA()
+
+        self.test = reference.LSOA_force()
+
+        self.assertEqual(self.test[self.LSOA_pf['LSOA Code'].values].tolist(), self.LSOA_pf['Police_force'].tolist())
+
+        self.assertEqual(reference.offence_categories()['anti-social behaviour'], 'anti-social behaviour')
+
+    def test_binary_tables(self):
+        """
+        Test reference tables saved in binary format load identically
+        """
+
+        self.LSOA_pf = reference.police_force_LSOA()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            self.npz_path = os.path.join(tmp_dir, 'PoliceforceLSOA.npz')
+
+            reference.save_binary(self.LSOA_pf, self.npz_path)
+
+            self.test = reference.load_binary(self.npz_path)
+
+        pd.testing.assert_frame_equal(self.test, self.LSOA_pf)
+
+        self.assertEqual(self.test['Police_force'].isna().sum(), self.LSOA_pf['Police_force'].isna().sum())
+
+    def test_binary_source(self):
+        """
+        Test binary copies record the csv they were built from and go stale when it changes
+        """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            self.csv_path = os.path.join(tmp_dir, 'table.csv')
+
+            with open(self.csv_path, 'w') as csv_file:
+                csv_file.write('a,b\n1,x\n2,\n')
+
+            self.npz_path = reference.binary_path(self.csv_path)
+
+            reference.save_binary(pd.read_csv(self.csv_path), self.npz_path,
+                                  source=reference.source_digest(self.csv_path))
+
+            self.assertEqual(reference.binary_source(self.npz_path), reference.source_digest(self.csv_path))
+
+            with open(self.csv_path, 'w') as csv_file:
+                csv_file.write('a,b\n1,y\n2,\n')
+
+            self.assertNotEqual(reference.binary_source(self.npz_path), reference.source_digest(self.csv_path))
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
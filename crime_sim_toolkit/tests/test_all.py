@@ -1,5 +1,6 @@
 import os
 import json
+import tempfile
 import unittest
 from unittest.mock import patch
 import numpy as np
@@ -8,6 +9,7 @@ import folium
 from crime_sim_toolkit import vis_utils
 import crime_sim_toolkit.initialiser as Initialiser
 import crime_sim_toolkit.poisson_sim as Poisson_sim
+from crime_sim_toolkit.counts import SparseCounts, CountTensor
 import pkg_resources
 
 # specified for directory passing test
@@ -258,6 +260,68 @@ class Test(unittest.TestCase):
 
         self.assertEqual(self.plot.columns.tolist(), ['datetime','Pred_counts','Actual','Difference'])
 
+    def test_error_metrics(self):
+        """
+        Test headless error metrics across replicates agree with error_Reporting
+        """
+
+        self.oobdata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_oobdata.csv'))
+
+        self.traindata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_traindata.csv'))
+
+        self.poi_data = self.poisson.SimplePoission(train_data = self.traindata, test_data = self.oobdata, method = 'simple',
+                                                    engine = 'vectorised', n_replicates = 3, rng = np.random.default_rng(1))
+
+        self.metrics = self.poisson.error_metrics(test_data = self.oobdata, simulated_data = self.poi_data)
+
+        self.assertEqual(self.metrics.index.tolist(), [0, 1, 2])
+
+        self.assertEqual(self.metrics.columns.tolist(), ['RMSE','MAE','MedAE','Simulated_total','Actual_total','Sampling_pct'])
+
+        self.comparison = self.poisson.error_Reporting(test_data = self.oobdata,
+                                                       simulated_data = self.poi_data[self.poi_data.Replicate == 1],
+                                                       plot = False, verbose = False)
+
+        self.assertAlmostEqual(self.metrics.loc[1, 'RMSE'], np.sqrt((self.comparison.Difference ** 2).mean()))
+
+        self.assertAlmostEqual(self.metrics.loc[1, 'MedAE'], self.comparison.Difference.median())
+
+        self.frame_metrics = self.poisson.error_metrics(test_data = self.oobdata,
+                                                        simulated_data = [frame for _, frame in self.poi_data.groupby('Replicate')])
+
+        pd.testing.assert_frame_equal(self.frame_metrics, self.metrics)
+
+    def test_backtest(self):
+        """
+        Test rolling-origin backtest scores every holdout year, method and window
+        reproducibly whatever the number of processes
+        """
+
+        self.fulldata = pd.concat([pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_traindata.csv')),
+                                   pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_oobdata.csv'))],
+                                  ignore_index=True)
+
+        self.results = self.poisson.backtest(self.fulldata, methods=['simple','zero'], mv_windows=[0, 1], seed=3, nprocs=1)
+
+        self.assertEqual(self.results.shape[0], 2 * 2 * 2)
+
+        self.assertEqual(sorted(self.results.Holdout_year.unique().tolist()), [2017, 2018])
+
+        self.assertEqual(self.results.columns.tolist()[:4], ['Holdout_year','Method','mv_window','Train_rows'])
+
+        self.assertTrue((self.results.Seconds > 0).all())
+
+        self.assertIsNone(Poisson_sim.Poisson_sim.backtest_data)
+
+        self.assertIsNone(Poisson_sim.Poisson_sim.backtest_stats)
+
+        self.pool_results = self.poisson.backtest(self.fulldata, methods=['simple','zero'], mv_windows=[0, 1], seed=3, nprocs=2)
+
+        pd.testing.assert_frame_equal(self.results.drop(columns='Seconds'), self.pool_results.drop(columns='Seconds'))
+
+        with self.assertRaises(ValueError):
+            self.poisson.backtest(self.fulldata, min_train_years=3)
+
     def test_sampler_week_agg(self):
         """
         Test for checking the output of the poisson sampler is as expected
@@ -280,6 +344,346 @@ class Test(unittest.TestCase):
 
         self.assertEqual(self.poi_data.shape[0], 14 * 6)
 
+    def test_sampler_vectorised(self):
+        """
+        Test the vectorised engine produces the same rows as the looped sampler
+        """
+
+        self.oobdata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_oobdata.csv'))
+
+        self.traindata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_traindata.csv'))
+
+        self.loop_data = self.poisson.SimplePoission(train_data = self.traindata, test_data = self.oobdata,
+                                                     method = 'zero', mv_window = 1)
+
+        self.poi_data = self.poisson.SimplePoission(train_data = self.traindata, test_data = self.oobdata,
+                                                    method = 'zero', mv_window = 1, engine = 'vectorised')
+
+        self.assertEqual(self.poi_data.columns.tolist(), ['Week','datetime','Crime_type','Counts','LSOA_code'])
+
+        self.assertEqual(self.poi_data.Week.unique().tolist(), [26,27,28,29,30,31])
+
+        key_cols = ['Week','datetime','Crime_type','LSOA_code']
+
+        pd.testing.assert_frame_equal(self.poi_data[key_cols].sort_values(key_cols).reset_index(drop=True),
+                                      self.loop_data[key_cols].sort_values(key_cols).reset_index(drop=True))
+
+        with self.assertRaises(ValueError):
+
+            self.poisson.SimplePoission(train_data = self.traindata, test_data = self.oobdata, engine = 'other')
+
+    def test_sampler_vectorised_leap_day(self):
+        """
+        Test day windows around the end of February match the looped sampler in leap and non-leap years
+        """
+
+        self.traindata = pd.DataFrame({'Counts' : [3, 1, 2, 4],
+                                       'Crime_type' : ['Burglary'] * 4,
+                                       'LSOA_code' : ['L1', 'L2', 'L3', 'L4'],
+                                       'datetime' : ['2015-02-28', '2016-02-29', '2015-03-03', '2015-12-31']})
+
+        self.oobdata = pd.DataFrame({'Counts' : 0,
+                                     'Crime_type' : 'Burglary',
+                                     'LSOA_code' : 'L1',
+                                     'datetime' : ['2016-02-28', '2016-03-01', '2017-02-28', '2017-03-01', '2017-12-31']})
+
+        key_cols = ['datetime','Crime_type','LSOA_code']
+
+        self.model = self.poisson.fit_model(self.traindata, mv_window=1)
+
+        for mv_window in [1, 60]:
+
+            self.loop_data = self.poisson.SimplePoission(train_data = self.traindata, test_data = self.oobdata,
+                                                         mv_window = mv_window)
+
+            self.poi_data = self.poisson.SimplePoission(train_data = self.traindata, test_data = self.oobdata,
+                                                        mv_window = mv_window, engine = 'vectorised')
+
+            pd.testing.assert_frame_equal(self.poi_data[key_cols].sort_values(key_cols).reset_index(drop=True),
+                                          self.loop_data[key_cols].sort_values(key_cols).reset_index(drop=True),
+                                          check_dtype=False)
+
+        # a window of one day around 1st March 2017 takes 28th February 2015 not 29th February 2016
+        self.rates = self.poisson.fit_rates(self.traindata.assign(datetime=pd.to_datetime(self.traindata.datetime)),
+                                            targets=pd.to_datetime(['2017-03-01', '2016-03-01']),
+                                            time_res='datetime', mv_window=1)
+
+        self.assertEqual(self.rates.LSOA_code.tolist(), ['L1', 'L2'])
+
+        # the model takes counts missing from the training data to be zero, as SparseCounts does
+        self.sparse_rates = self.poisson.fit_rates(SparseCounts.from_frame(self.traindata),
+                                                   targets=pd.to_datetime(['2017-03-01', '2016-03-01']),
+                                                   time_res='datetime', mv_window=1)
+
+        pd.testing.assert_frame_equal(self.model.rates_frame(pd.to_datetime(['2017-03-01', '2016-03-01'])), self.sparse_rates)
+
+    def test_sampler_vectorised_day(self):
+        """
+        Test the vectorised engine when sampling using days
+        """
+
+        self.oobdata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_oobDay_data.csv'))
+
+        self.traindata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_trainDay_data.csv'))
+
+        self.poi_data = self.poisson_day.SimplePoission(train_data = self.traindata, test_data = self.oobdata,
+                                                        method = 'simple', engine = 'vectorised')
+
+        self.assertEqual(self.poi_data.columns.tolist(), ['datetime','Crime_type','Counts','LSOA_code'])
+
+        self.assertEqual(len(self.poi_data.datetime.dt.day.unique()), 31)
+
+        # all zero history should always simulate zero counts
+        self.traindata['Counts'] = 0
+
+        self.poi_data = self.poisson_day.SimplePoission(train_data = self.traindata, test_data = self.oobdata,
+                                                        method = 'zero', engine = 'vectorised')
+
+        self.assertEqual(self.poi_data.Counts.sum(), 0)
+
+        self.poi_data = self.poisson_day.SimplePoission(train_data = self.traindata, test_data = self.oobdata,
+                                                        method = 'mixed', engine = 'vectorised')
+
+        self.assertEqual(self.poi_data.columns.tolist(), ['datetime','Crime_type','Counts','LSOA_code'])
+
+    def test_sampler_replicates(self):
+        """
+        Test drawing many replicates from a single fit
+        """
+
+        self.oobdata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_oobdata.csv'))
+
+        self.traindata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_traindata.csv'))
+
+        self.poi_data = self.poisson.SimplePoission(train_data = self.traindata, test_data = self.oobdata,
+                                                    engine = 'vectorised', n_replicates = 50)
+
+        self.assertEqual(self.poi_data.columns.tolist(), ['Replicate','Week','datetime','Crime_type','Counts','LSOA_code'])
+
+        self.assertEqual(self.poi_data.shape[0], 14 * 6 * 50)
+
+        self.assertEqual(self.poi_data.Replicate.unique().tolist(), list(range(50)))
+
+        self.summary = self.poisson.SimplePoission(train_data = self.traindata, test_data = self.oobdata,
+                                                   engine = 'vectorised', n_replicates = 50,
+                                                   summarise = True, quantiles = (0.05, 0.95))
+
+        self.assertEqual(self.summary.columns.tolist(), ['Week','datetime','Crime_type','LSOA_code',
+                                                         'Counts_mean','Counts_q0.05','Counts_q0.95'])
+
+        self.assertTrue((self.summary['Counts_q0.05'] <= self.summary['Counts_q0.95']).all())
+
+        with self.assertRaises(ValueError):
+
+            self.poisson.SimplePoission(train_data = self.traindata, test_data = self.oobdata, n_replicates = 50)
+
+    def test_parallel_ensemble(self):
+        """
+        Test parallel ensembles are reproducible whatever the number of processes
+        """
+
+        self.oobdata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_oobdata.csv'))
+
+        self.traindata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_traindata.csv'))
+
+        self.ensemble1 = self.poisson.ParallelEnsemble(train_data = self.traindata, test_data = self.oobdata,
+                                                       n_replicates = 25, seed = 42, nprocs = 1)
+
+        self.ensemble2 = self.poisson.ParallelEnsemble(train_data = self.traindata, test_data = self.oobdata,
+                                                       n_replicates = 25, seed = 42, nprocs = 2)
+
+        self.assertEqual(self.ensemble1.shape[0], 14 * 6 * 25)
+
+        pd.testing.assert_frame_equal(self.ensemble1, self.ensemble2)
+
+    def test_fit_rates_mixed(self):
+        """
+        Test the batched linear fit for the mixed method predicts the year after the training data
+        """
+
+        self.traindata = pd.DataFrame({'Counts' : [1, 3, 2, 2],
+                                       'Crime_type' : ['Burglary'] * 4,
+                                       'LSOA_code' : ['E01010569', 'E01010569', 'E01010570', 'E01010570'],
+                                       'Week' : [26] * 4,
+                                       'datetime' : pd.to_datetime(['2016-06-01', '2017-06-01', '2016-06-01', '2017-06-01'])})
+
+        self.rates = self.poisson.fit_rates(self.traindata, targets=[26], time_res='Week', method='mixed')
+
+        self.assertEqual(self.rates.Rate.tolist(), [2, 2])
+
+        self.assertEqual(self.rates.Trend.tolist(), [5, 2])
+
+    def test_fit_rates_windows(self):
+        """
+        Test fitting several moving window sizes in one pass
+        """
+
+        self.traindata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_traindata.csv'),
+                                     parse_dates=['datetime'])
+
+        self.rates = self.poisson.fit_rates(self.traindata, targets=[26, 27], time_res='Week', mv_window=[0, 2])
+
+        self.assertEqual(self.rates.columns.tolist()[0], 'mv_window')
+
+        self.assertEqual(self.rates.mv_window.unique().tolist(), [0, 2])
+
+        self.rates0 = self.poisson.fit_rates(self.traindata, targets=[26, 27], time_res='Week', mv_window=0)
+
+        self.assertEqual(self.rates[self.rates.mv_window == 0].Rate.tolist(), self.rates0.Rate.tolist())
+
+    def test_fit_rates_sparse(self):
+        """
+        Test rates fitted from sparse counts and count tensors match rates fitted from the full counts frame
+        """
+
+        self.traindata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_trainDay_data.csv'),
+                                     parse_dates=['datetime'])
+
+        self.sparse = SparseCounts.from_frame(self.traindata)
+
+        self.tensor = CountTensor.from_frame(self.traindata)
+
+        self.targets = pd.to_datetime(['2018-07-05', '2018-07-20'])
+
+        for method in ['simple', 'zero', 'mixed']:
+
+            self.rates = self.poisson.fit_rates(self.traindata, targets=self.targets, time_res='datetime',
+                                                method=method, mv_window=2)
+
+            self.assertTrue(len(self.rates) > 0)
+
+            for counts in [self.sparse, self.tensor]:
+
+                self.counts_rates = self.poisson.fit_rates(counts, targets=self.targets, time_res='datetime',
+                                                           method=method, mv_window=2)
+
+                pd.testing.assert_frame_equal(self.counts_rates.sort_values(['datetime','Crime_type']).reset_index(drop=True),
+                                              self.rates.sort_values(['datetime','Crime_type']).reset_index(drop=True))
+
+    def test_fit_model(self):
+        """
+        Test a fitted model matches fit_rates and survives saving and loading
+        """
+
+        self.oobdata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_oobdata.csv'))
+
+        self.traindata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_traindata.csv'),
+                                     parse_dates=['datetime'])
+
+        self.model = self.poisson.fit_model(self.traindata, mv_window=1)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            self.model.save(os.path.join(tmp_dir, 'model.npz'))
+
+            self.loaded = Poisson_sim.PoissonModel.load(os.path.join(tmp_dir, 'model.npz'))
+
+        self.rates = self.poisson.fit_rates(self.traindata, targets=[26, 27, 28], time_res='Week',
+                                            method='zero', mv_window=1)
+
+        self.assertEqual(self.loaded.rates_frame([26, 27, 28], method='zero').Rate.tolist(), self.rates.Rate.tolist())
+
+        self.poi_data = self.loaded.sample(self.oobdata.Week.unique(), method='mixed', year=2018)
+
+        self.assertEqual(self.poi_data.columns.tolist(), ['Week','datetime','Crime_type','Counts','LSOA_code'])
+
+        self.assertEqual(self.poi_data.shape[0], 14 * 6)
+
+    def test_model_update(self):
+        """
+        Test folding the last month of training data into a model fitted on the rest
+        matches a model fitted on all of it
+        """
+
+        self.traindata = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/test_traindata.csv'),
+                                     parse_dates=['datetime'])
+
+        self.last_month = self.traindata.datetime.max().to_period('M')
+
+        self.is_new = self.traindata.datetime.dt.to_period('M') == self.last_month
+
+        self.model = self.poisson.fit_model(self.traindata[~self.is_new], mv_window=1)
+
+        self.model.update(self.traindata[self.is_new])
+
+        self.full_model = self.poisson.fit_model(self.traindata, mv_window=1)
+
+        for method in ['simple', 'zero', 'mixed']:
+
+            self.updated_rates = self.model.rates_frame(np.arange(1, 54), method=method)
+
+            self.full_rates = self.full_model.rates_frame(np.arange(1, 54), method=method)
+
+            pd.testing.assert_frame_equal(self.updated_rates.sort_values(['Week','Crime_type','LSOA_code']).reset_index(drop=True),
+                                          self.full_rates.sort_values(['Week','Crime_type','LSOA_code']).reset_index(drop=True))
+
+    def test_model_update_cells(self):
+        """
+        Test an update only alters the statistics of cells with new counts and keeps new
+        labels longer than those of a loaded model
+        """
+
+        self.traindata = pd.DataFrame({'Counts' : [1, 2, 3, 4],
+                                       'Crime_type' : ['Burglary', 'Burglary', 'Drugs', 'Drugs'],
+                                       'LSOA_code' : ['L1', 'L2', 'L1', 'L2'],
+                                       'datetime' : pd.to_datetime(['2016-06-01'] * 4)})
+
+        self.newdata = pd.DataFrame({'Counts' : [5, 6],
+                                     'Crime_type' : ['Burglary', 'Vehicle crime'],
+                                     'LSOA_code' : ['L2', 'E01010569'],
+                                     'datetime' : pd.to_datetime(['2016-06-01', '2017-06-02'])})
+
+        self.model = self.poisson.fit_model(self.traindata)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            self.model.save(os.path.join(tmp_dir, 'model.npz'))
+
+            self.model = Poisson_sim.PoissonModel.load(os.path.join(tmp_dir, 'model.npz'))
+
+        self.old_cells = dict(zip(zip(*np.unravel_index(self.model.cells, self.model.cell_shape())),
+                                  self.model.cell_stats['total']))
+
+        self.model.update(self.newdata)
+
+        self.assertEqual(self.model.crime_types.tolist(), ['Burglary', 'Drugs', 'Vehicle crime'])
+
+        self.assertEqual(self.model.LSOA_codes.tolist(), ['L1', 'L2', 'E01010569'])
+
+        self.assertTrue((np.diff(self.model.cells) > 0).all())
+
+        self.new_cells = dict(zip(zip(*np.unravel_index(self.model.cells, self.model.cell_shape())),
+                                  self.model.cell_stats['total']))
+
+        # (slot, crime, LSOA) cells of 1st June (slot 152) and 2nd June (slot 153), only
+        # Burglary in L2 and the new Vehicle crime cell in E01010569 are altered
+        self.old_cells[(152, 0, 1)] += 5
+
+        self.old_cells[(153, 2, 2)] = 6
+
+        self.assertEqual(self.new_cells, self.old_cells)
+
+        # fixed width text labels, as saved, are not cut to their width
+        self.assertEqual(Poisson_sim.PoissonModel.extend_axis(np.array(['L1', 'L2']), ['L2', 'E01010569']).tolist(),
+                         ['L1', 'L2', 'E01010569'])
+
+    def test_circular_window_sum(self):
+        """
+        Test rolling sums wrap round the end of the year
+        """
+
+        self.slots = np.arange(1, 53)
+
+        self.test1 = Poisson_sim.Poisson_sim.circular_window_sum(self.slots, window=1)
+
+        self.assertEqual(self.test1[0], 52 + 1 + 2)
+
+        self.assertEqual(self.test1[51], 51 + 52 + 1)
+
+        self.test2 = Poisson_sim.Poisson_sim.circular_window_sum(self.slots, window=30)
+
+        self.assertTrue((self.test2 == self.slots.sum()).all())
+
     def test_moving_window_week(self):
 
         self.week = 4
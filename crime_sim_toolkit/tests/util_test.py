@@ -88,6 +88,41 @@ class Test(unittest.TestCase):
 
         #self.assertEqual(self.descriptions.columns.tolist(), ['UID','datetime','Crime_description','Crime_type','LSOA_code','Police_force'])
 
+    def test_LSOA_to_force(self):
+        """
+        Test police forces are looked up from LSOA codes or their integer positions
+        """
+
+        self.LSOA_force = utils.LSOA_force_index()
+
+        self.positions = utils.LSOA_force_positions(['E01010646', 'E01020634'], self.LSOA_force)
+
+        self.assertEqual(utils.LSOA_to_force(['E01010646', 'E01020634'], self.LSOA_force).tolist(),
+                         ['West Yorkshire', 'Durham'])
+
+        self.assertEqual(utils.LSOA_to_force(self.positions, self.LSOA_force).tolist(),
+                         ['West Yorkshire', 'Durham'])
+
+        self.assertTrue(pd.isnull(utils.LSOA_to_force(['not an LSOA'], self.LSOA_force)[0]))
+
+    def test_aggregate_to_force(self):
+        """
+        Test bincount aggregation to police force matches grouping by police force
+        """
+
+        self.data = pd.DataFrame({'datetime' : ['2017-01-02', '2017-01-01', '2017-01-01', '2017-01-01'],
+                                  'Crime_type' : ['Burglary', 'Burglary', 'Burglary', 'Drugs'],
+                                  'LSOA_code' : ['E01010646', 'E01010646', 'E01011229', 'E01020634'],
+                                  'Counts' : [1, 2, 3, 4]})
+
+        self.test = utils.aggregate_to_force(self.data)
+
+        self.data['LSOA_code'] = utils.LSOA_to_force(self.data['LSOA_code'])
+
+        self.expected = self.data.groupby(['datetime','Crime_type','LSOA_code'])['Counts'].sum().reset_index()
+
+        pd.testing.assert_frame_equal(self.test, self.expected, check_dtype=False)
+
     def test_validate_datetime(self):
         """
         Test that adding zero function works
@@ -107,6 +142,32 @@ class Test(unittest.TestCase):
         self.assertFalse(np.dtype('datetime64[ns]') in self.test2.dtypes.tolist())
 
 
+    def test_validate_datetime_copy(self):
+        """
+        Test validate_datetime configures in place when not copying
+        """
+        self.data = pd.read_csv(pkg_resources.resource_filename(resource_package, 'tests/testing_data/report_2_counts.csv'))
+
+        self.test1 = utils.validate_datetime(self.data)
+
+        self.assertFalse(self.test1 is self.data)
+
+        self.test2 = utils.validate_datetime(self.test1, copy=False)
+
+        self.assertTrue(self.test2 is self.test1)
+
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(self.test2.datetime))
+
+    def test_day_of_year(self):
+        """
+        Test day of year keys match across leap and non-leap years
+        """
+
+        self.dates = pd.Series(pd.to_datetime(['2017-01-01', '2017-03-01', '2016-03-01',
+                                               '2016-02-29', '2017-12-31', '2016-12-31']))
+
+        self.assertEqual(utils.day_of_year(self.dates).tolist(), [1, 61, 61, 60, 366, 366])
+
     def test_sample_perturb(self):
         """
         Test that adding zero function works
@@ -137,5 +198,22 @@ class Test(unittest.TestCase):
         pd.testing.assert_series_equal(self.output.Crime_type.str.lower(), self.output.Crime_category,
                                        check_names=False)
 
+    def test_pool_setup(self):
+        """
+        Test pool_setup passes SeedSequences through and seeds ints reproducibly
+        """
+
+        self.seed_seq = np.random.SeedSequence(5)
+
+        self.assertIs(utils.pool_setup(self.seed_seq, 2)[0], self.seed_seq)
+
+        self.assertEqual(utils.pool_setup(5)[0].entropy, self.seed_seq.entropy)
+
+        self.assertEqual(utils.pool_setup(5, 3)[1], 3)
+
+        self.assertEqual(utils.pool_setup(5, 3, n_tasks=2)[1], 2)
+
+        self.assertTrue(utils.pool_setup()[1] >= 1)
+
 if __name__ == "__main__":
     unittest.main(verbosity=2)
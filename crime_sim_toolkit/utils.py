@@ -4,10 +4,9 @@ Utility functions for general use
 
 import pandas as pd
 import numpy as np
+import multiprocessing as mp
 from calendar import monthrange
-import pkg_resources
-
-resource_package = 'crime_sim_toolkit'
+from crime_sim_toolkit import reference
 
 def counts_to_reports(counts_frame):
     """
@@ -95,18 +94,18 @@ def populate_offence(crime_frame):
     crime_frame.columns = crime_frame.columns.str.replace(' ','_')
 
     # initially load reference tables
-    LSOA_pf_reference = pd.read_csv(pkg_resources.resource_filename(resource_package, 'src/LSOA_data/PoliceforceLSOA.csv'),
-                                    index_col=0)
+    LSOA_pf_reference = reference.police_force_LSOA()
+
+    LSOA_force = reference.LSOA_force()
 
-    descriptions_reference = pd.read_csv(pkg_resources.resource_filename(resource_package, 'src/prc-pfa-201718_new.csv'),
-                             index_col=0)
+    descriptions_reference = reference.offence_descriptions()
 
     # test if the first instance in LSOA code is within police force frame?
     # if value is not in the list of police forces from reference frame
     # add police force column
     if crime_frame['LSOA_code'].unique().tolist()[0] not in LSOA_pf_reference.Police_force.tolist():
 
-        crime_frame['Police_force'] = crime_frame.LSOA_code.map(lambda x: LSOA_pf_reference[LSOA_pf_reference['LSOA Code'].isin([x])].Police_force.tolist()[0])
+        crime_frame['Police_force'] = LSOA_to_force(crime_frame['LSOA_code'], LSOA_force)
 
     # else convert LSOA_code to Police_force column
     else:
@@ -152,27 +151,137 @@ def populate_offence(crime_frame):
     return populated_frame
 
 
-def validate_datetime(passed_dataframe):
+def LSOA_force_index(LSOA_pf_reference=None):
+    """
+    Utility function building a lookup of police force by LSOA code, a Pandas series
+    indexed by LSOA code holding police forces as a categorical. Integer codes of the
+    forces (in sorted order) are available from .cat.codes.
+    Inputs : LSOA_pf_reference, the PoliceforceLSOA reference frame. Default uses the
+                                shared lookup of src/LSOA_data/PoliceforceLSOA.csv
+    """
+
+    if LSOA_pf_reference is None:
+        return reference.LSOA_force()
+
+    return reference.build_LSOA_force(LSOA_pf_reference)
+
+def LSOA_force_positions(LSOA_codes, LSOA_force):
+    """
+    Utility function returning the positions of LSOAs within an LSOA_force_index.
+    LSOA_codes may be LSOA code strings or precomputed integer positions, which are
+    returned as they are. Unknown LSOAs have position -1.
+    """
+
+    LSOA_codes = np.asarray(LSOA_codes)
+
+    if np.issubdtype(LSOA_codes.dtype, np.integer):
+        return LSOA_codes
+
+    return LSOA_force.index.get_indexer(LSOA_codes)
+
+def LSOA_to_force(LSOA_codes, LSOA_force=None):
+    """
+    Utility function returning the police force of each of an array of LSOAs
+    Inputs : LSOA_codes, array of LSOA code strings or integer positions within LSOA_force
+             LSOA_force, lookup from LSOA_force_index. Default builds one from the reference data
+    Output : array of police forces, NaN for unknown LSOAs
+    """
+
+    if LSOA_force is None:
+        LSOA_force = LSOA_force_index()
+
+    positions = LSOA_force_positions(LSOA_codes, LSOA_force)
+
+    forces = LSOA_force.values.take(positions, allow_fill=True)
+
+    return np.asarray(forces, dtype=object)
+
+def aggregate_to_force(counts_frame, LSOA_force=None, keys=['datetime','Crime_type']):
+    """
+    Utility function summing counts of LSOAs into police force areas with a single bincount,
+    equivalent to replacing LSOA_code with police force and grouping by keys and LSOA_code
+    Inputs : counts_frame, frame of counts with an LSOA_code column of LSOA code strings or
+                           integer positions within LSOA_force
+             LSOA_force, lookup from LSOA_force_index. Default builds one from the reference data
+             keys, other columns counts are grouped by
+    Output : frame of keys, LSOA_code (police force) and summed Counts sorted by these columns.
+             LSOAs without a police force are dropped
+    """
+
+    if LSOA_force is None:
+        LSOA_force = LSOA_force_index()
+
+    forces = LSOA_force.cat.categories
+
+    positions = LSOA_force_positions(counts_frame['LSOA_code'], LSOA_force)
+
+    # as with groupby, LSOAs without a police force are dropped
+    counts_frame = counts_frame[positions >= 0]
+
+    force_codes = LSOA_force.cat.codes.values.take(positions[positions >= 0])
+
+    # sorted integer codes of each key so the flattened cells follow groupby order
+    key_codes = []
+    key_labels = []
+
+    for key in keys:
+        codes, labels = pd.factorize(counts_frame[key], sort=True)
+        key_codes.append(codes)
+        key_labels.append(labels)
+
+    shape = tuple(len(labels) for labels in key_labels) + (len(forces),)
+
+    cells = np.ravel_multi_index(tuple(key_codes) + (force_codes,), shape)
+
+    summed = np.bincount(cells, weights=counts_frame['Counts'].values, minlength=np.prod(shape))
+
+    observed = np.flatnonzero(np.bincount(cells, minlength=np.prod(shape)))
+
+    cell_codes = np.unravel_index(observed, shape)
+
+    aggregated = pd.DataFrame({key : labels.take(codes) for key, labels, codes in zip(keys, key_labels, cell_codes)})
+
+    aggregated['LSOA_code'] = forces.take(cell_codes[-1])
+
+    aggregated['Counts'] = summed[observed].astype(counts_frame['Counts'].dtype)
+
+    return aggregated
+
+def validate_datetime(passed_dataframe, copy=True):
     """
     Utility function to ensure passed dataframes datetime column is configured as
-    datetime dtype.
+    datetime dtype. A copy is returned unless copy is False, in which case the
+    passed dataframe is configured in place and returned.
     """
 
     try:
 
-        if np.dtype('datetime64[ns]') not in passed_dataframe.dtypes:
+        if not pd.api.types.is_datetime64_any_dtype(passed_dataframe['datetime']):
 
-            passed_dataframe['datetime'] = passed_dataframe['datetime'].apply(pd.to_datetime)
-
-            print('Datetime column configured.')
+            # one vectorised parse of the column rather than one per row
+            passed_dataframe['datetime'] = pd.to_datetime(passed_dataframe['datetime'])
 
     except KeyError:
         print('No datetime column detected. Dataframe unaltered.')
 
+    if not copy:
+        return passed_dataframe
+
     validated_date_frame = passed_dataframe.copy()
 
     return validated_date_frame
 
+def day_of_year(datetimes):
+    """
+    Utility function returning an integer day of year key (1-366) for a Pandas series
+    of datetimes. Days are numbered as in a leap year so a given day and month have the
+    same key in every year, i.e. 1st March is always 61 and 29th February is 60.
+    """
+
+    days_before_month = np.array([0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+
+    return days_before_month[datetimes.dt.month.values - 1] + datetimes.dt.day.values
+
 def sample_perturb(counts_frame, crime_type, pct_change):
     """
     Utility function to increase the counts of specific crime types
@@ -233,17 +342,29 @@ def reverse_offence(dataframe):
     created by populate_offence util function.
     """
 
-    descriptions_reference = pd.read_csv(pkg_resources.resource_filename(resource_package, 'src/prc-pfa-201718_new.csv'),
-                             index_col=0)
+    # lower case Police UK category of each lower case offence description
+    reference_dict = reference.offence_categories()
 
-    reference_dict = descriptions_reference[['Policeuk_Cat','Offence_Description']].set_index('Offence_Description')['Policeuk_Cat'].to_dict()
+    dataframe['Crime_category'] = dataframe.Crime_description.map(reference_dict)
 
-    # convert to lowercase
-    reference_dict = dict((idx.lower(), val.lower()) for idx, val in reference_dict.items())
+    return dataframe
 
-    # manually add in anti-social behaviour (as not present in reference table)
-    reference_dict['anti-social behaviour'] = 'anti-social behaviour'
+def pool_setup(seed=None, nprocs=None, n_tasks=None):
+    """
+    Utility function giving the SeedSequence and number of processes of a process pool run.
+    seed may be an int, a SeedSequence (returned as it is) or None, which draws fresh entropy.
+    nprocs defaults to mp.cpu_count() and is capped at n_tasks, so no process is left idle.
+    """
 
-    dataframe['Crime_category'] = dataframe.Crime_description.map(reference_dict)
+    if isinstance(seed, np.random.SeedSequence):
+        seed_seq = seed
+    else:
+        seed_seq = np.random.SeedSequence(seed)
 
-    return dataframe
+    if nprocs is None:
+        nprocs = mp.cpu_count()
+
+    if n_tasks is not None:
+        nprocs = max(min(nprocs, n_tasks), 1)
+
+    return seed_seq, nprocs
@@ -6,6 +6,7 @@ import pandas as pd
 import folium
 import branca
 import pkg_resources
+from crime_sim_toolkit import reference
 
 # Could be any dot-separated package/module name or a "Requirement"
 resource_package = 'crime_sim_toolkit'
@@ -111,13 +112,9 @@ def get_choropleth(data=None, inline=True, counts_col='Counts'):
 
 def match_LSOA_to_LA(LSOA_cd):
 
-    # load LSOA population frame
-    # this contains LSOA code, MSOA code and LA names
-    LSOA_pop = pd.read_csv(pkg_resources.resource_filename(resource_package, 'src/LSOA_data/census_2011_population_hh.csv'))
-
-    row_of_interest = LSOA_pop.set_index('LSOA Code').loc[LSOA_cd]
-
-    return row_of_interest['Local authority code']
+    # shared lookup of local authority code by LSOA code
+    # from the LSOA population frame
+    return reference.LSOA_local_authority()[LSOA_cd]
 
 def get_LA_GeoJson(LA_cd):
     """
@@ -20,6 +20,8 @@ setup(
     long_description_content_type='text/markdown',
     python_requires= '>=3.6',
     packages=find_packages(),
+    # minimum versions of the numpy Generator and pandas APIs used (see requirements.txt)
+    install_requires=['numpy>=1.17.0', 'pandas>=1.1.5'],
     zip_safe=False,
     # removed as a test
     include_package_data=True